@@ -19,14 +19,13 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import h5py
+import functools
 import numpy as np
+import pandas as pd
 import time
-import progressbar
-import math
 from local_imports import sys  # this adds PyVMAP to PATH
-import PyVMAP as VMAP
-from func import VmapWrite, PermasModelRead, PermasModelPostprocess, PermasResultsRead
+from func import VmapWrite, PermasHdfRead, PermasModelRead, \
+    PermasModelPostprocess, PermasResultsRead, PermasResultsPostprocess
 from func import auxiliary as aux
 
 # %% startup
@@ -51,12 +50,14 @@ OUTPUTFILENAME = '.'.join(
 # check input file's existence
 aux.assert_file_exists(folder_data + INPUTFILENAME_model)
 
-# load the model input file
-inputfile_model = h5py.File(folder_data + INPUTFILENAME_model, 'r')
+# load the model input file, with a chunk cache sized for its datasets
+inputfile_model = PermasHdfRead.open_permas_hdf(
+    folder_data + INPUTFILENAME_model)
 # if no file for results is defined, use the model input file
 if INPUTFILENAME_results != '':
     aux.assert_file_exists(folder_data + INPUTFILENAME_results)
-    inputfile_results = h5py.File(folder_data + INPUTFILENAME_results, 'r')
+    inputfile_results = PermasHdfRead.open_permas_hdf(
+        folder_data + INPUTFILENAME_results)
 else:
     inputfile_results = inputfile_model
     INPUTFILENAME_results = INPUTFILENAME_model
@@ -75,11 +76,13 @@ timesteps_user, variables_node_user = aux.determine_times_vars(
 
 # %% read PERMAS
 print(aux.sep_big + 'READING PERMAS\n' + aux.sep_big)
-# determination of process time
-times = []
-times.append(time.process_time())
-# %%% GEOMETRY
-# read
+# wall-clock durations of the conversion steps, reported at the end
+timings = {}
+time_start = time.perf_counter()
+time_step = time_start
+# %%% GEOMETRY and VARIABLES
+# read one after the other: h5py 2.10 holds the GIL and its global lock in
+# every call, so threads would not overlap the reads
 nodes, \
     esets, \
     partnames, \
@@ -96,6 +99,16 @@ nodes, \
     eset_material, \
     coorsystems \
     = PermasModelRead.PermasModelRead(inputfile_model)
+analysis_info, \
+    variablestypes_nodes_list, \
+    node_results_pd \
+    = PermasResultsRead.PermasResultsRead(
+        inputfile_results,
+        timesteps_user,
+        variables_node_user)
+
+timings['reading model and results'] = time.perf_counter() - time_step
+time_step = time.perf_counter()
 
 # some post-processing
 nodes, \
@@ -119,19 +132,9 @@ nodes, \
         surfs,
         nsets)
 
-times.append(time.process_time())
-print((aux.sep_small + 'PROCESSTIME FOR READING AND POSTPROCESSING MODEL: {:5.3f}s\n' + aux.sep_small)
-      .format(times[-1] - times[-2]))
+timings['postprocessing model'] = time.perf_counter() - time_step
 
 # %%% VARIABLES
-analysis_info, \
-    variablestypes_nodes_list, \
-    node_results_pd \
-    = PermasResultsRead.PermasResultsRead(
-        inputfile_results,
-        timesteps_user,
-        variables_node_user)
-
 num_noderesults = len(node_results_pd)
 num_temporal = len(timesteps_user)
 if num_noderesults > 0 and num_temporal > 0:
@@ -143,204 +146,183 @@ else:
 
 print()
 
-times.append(time.process_time())
-print((aux.sep_small + 'PROCESSTIME FOR READING RESULTS: {:5.3f}s\n' + aux.sep_small)
-      .format(times[-1] - times[-2]))
-
 
 # %% write VMAP
 print(aux.sep_big + 'WRITING VMAP\n' + aux.sep_big)
-outputfile = VMAP.VMAPFile(folder_data + OUTPUTFILENAME)
-
-# define element types
-esettype_to_vmapelemtype = {'HEXE8': 1, 'TET10': 2}
+# the output file is closed on leaving the block, also if an error occurs
+with VmapWrite.VmapWriteFile(folder_data + OUTPUTFILENAME) as outputfile:
+    # define element types
+    esettype_to_vmapelemtype = {'HEXE8': 1, 'TET10': 2}
 
-VmapWrite.VmapWriteInitial(outputfile)
-
-# %%% MATERIAL
-# create and fill the MATERIAL group bottom-up: PARAMETERS -> MATERIALCARD -> <MAT> -> MATERIAL
-print('writing MATERIAL ... ', end='')
-VmapWrite.VmapWriteMaterial(outputfile, materials)
-print('done')
-print()
+    VmapWrite.VmapWriteInitial(outputfile)
 
-# %%% SYSTEM
-print('writing SYSTEM ...')
-# %%%% ELEMENTTYPES
-VmapWrite.VmapWriteEtypeItype(outputfile, esets_types, esettype_to_vmapelemtype)
+    # %%% MATERIAL
+    # create and fill the MATERIAL group bottom-up: PARAMETERS -> MATERIALCARD -> <MAT> -> MATERIAL
+    print('writing MATERIAL ... ', end='')
+    VmapWrite.VmapWriteMaterial(outputfile, materials)
+    print('done')
+    print()
 
-# %%%% COORDINATESYSTEMS
-VmapWrite.VmapWriteCoorsys(outputfile, coorsystems)
-print()
+    # %%% SYSTEM
+    print('writing SYSTEM ...')
+    # %%%% ELEMENTTYPES
+    VmapWrite.VmapWriteEtypeItype(outputfile, esets_types,
+                                  esettype_to_vmapelemtype)
 
-# %%% GEOMETRY
-print('writing GEOMETRY ...')
-times.append(time.process_time())
-parts_numnodes, esets_nodes_unique = \
-    VmapWrite.VmapWriteGeometry(outputfile,
-                                partnames,
-                                nodes,
-                                nodes_all_ids,
-                                nsets_names,
-                                esets,
-                                esets_types,
-                                eset_material,
-                                esettype_to_vmapelemtype,
-                                elements_hexe8,
-                                elements_hexe8_ids,
-                                elements_tet10,
-                                elements_tet10_ids,
-                                nsets,
-                                nsets_first,
-                                surfs_ids,
-                                surfs_firstel,
-                                surfs_flat,
-                                sfsets_ids,
-                                sfsets_names,
-                                materials)
-
-times.append(time.process_time())
-print((aux.sep_small + 'PROCESSTIME FOR WRITING GEOMETRY: {:5.3f}s\n' + aux.sep_small)
-      .format(times[-1] - times[-2]))
+    # %%%% COORDINATESYSTEMS
+    VmapWrite.VmapWriteCoorsys(outputfile, coorsystems)
+    print()
 
-# %%% VARIABLES
-if num_noderesults > 0 and num_temporal > 0:
-    print('writing VARIABLES ...')
-    # %%%% assign POINTS to PARTS
-    # TODO this is the bottleneck of the overall performance. to improve, one might
-    # have to get rid of pandas
-    print('assigning nodes to parts ... ', flush=True)
-    # because this may take long, let's have a progressbar
-    widget = [' [',
-              progressbar.Timer(format='elapsed time: %(elapsed)s'),
-              '] ',
-              progressbar.Bar('*'), ' (',
-              progressbar.ETA(), ') ',
-              ]
-    # to keep the slowdown due to progressbar minimal, we only want to resolve progress with 0.1 to 1.0% accuracy
-    # on the dev's machine and with the provided test data, this still slows the overall process down from ~5.5s to ~5.8s
-    if num_noderesults < 100:
-        print('ERROR: progressbar requires at least 100 nodal results')
-        sys.exit(1)
-    num_noderesults_order = int(math.log10(num_noderesults))
-    divisor = 10**(num_noderesults_order - 2)
-    bar_max_value = int(num_noderesults/divisor)
-    bar = progressbar.ProgressBar(
-        max_value=bar_max_value, widgets=widget).start()
-    ct_bar = 0
-    # go
-    if analysis_info['temporal_values'] != [] and variablestypes_nodes_list != []:
-        if len(partnames) > 1:
-            # list containing the partname for each node
-            nodes_results_part_list = [None]*len(node_results_pd)
-            node_results_pd = node_results_pd.rename(columns={'Index': 'EID'})
-            node_results_pd = node_results_pd.set_index(
-                np.arange(node_results_pd.shape[0]))
-            for i in range(len(node_results_pd)):
-                if i % divisor == 0:
-                    bar.update(ct_bar)
-                    ct_bar += 1
-                node = node_results_pd.node[i]
-                # find part of current node
-                found_part_of_node = False
-                for ct_part, partname in enumerate(partnames):
-                    if node in esets_nodes_unique[ct_part]:
-                        nodes_results_part_list[i] = partname
-                        found_part_of_node = True
-                        break
-                if not found_part_of_node:
-                    print('ERROR: could not find part of node ' + str(node))
+    # %%% GEOMETRY
+    print('writing GEOMETRY ...')
+    time_step = time.perf_counter()
+    parts_numnodes, esets_nodes_unique = \
+        VmapWrite.VmapWriteGeometry(outputfile,
+                                    partnames,
+                                    nodes,
+                                    nodes_all_ids,
+                                    nsets_names,
+                                    esets,
+                                    esets_types,
+                                    eset_material,
+                                    esettype_to_vmapelemtype,
+                                    elements_hexe8,
+                                    elements_hexe8_ids,
+                                    elements_tet10,
+                                    elements_tet10_ids,
+                                    nsets,
+                                    nsets_first,
+                                    surfs_ids,
+                                    surfs_firstel,
+                                    surfs_flat,
+                                    sfsets_ids,
+                                    sfsets_names,
+                                    materials)
+
+    timings['writing geometry'] = time.perf_counter() - time_step
+
+    # %%% VARIABLES
+    if num_noderesults > 0 and num_temporal > 0:
+        print('writing VARIABLES ...')
+        # %%%% assign POINTS to PARTS
+        print('assigning nodes to parts ... ', end='', flush=True)
+        time_step = time.perf_counter()
+        if analysis_info['temporal_values'] != [] \
+                and variablestypes_nodes_list != []:
+            # node IDs are extracted from pandas once, all element access
+            # below works on the numpy array
+            node_ids = node_results_pd.node.to_numpy()
+            if len(partnames) > 1:
+                part_ids = PermasResultsPostprocess.assign_parts(
+                    node_ids, esets_nodes_unique)
+                if (part_ids == -1).any():
+                    print('\nERROR: could not find part of node ' +
+                          str(node_ids[part_ids == -1][0]))
                     sys.exit(1)
+            else:
+                # single part: nothing to search
+                part_ids = np.zeros(node_ids.shape[0], dtype=np.int32)
+            # the part indices are the codes of the categorical, so no
+            # partname strings are created per node
             node_results_pd = node_results_pd.assign(
-                PART=nodes_results_part_list)
+                PART=pd.Categorical.from_codes(part_ids, partnames))
+            # categorical columns: comparing and grouping work on integer codes
+            # instead of Python objects
+            node_results_pd = node_results_pd.astype(
+                {'variabletype': pd.CategoricalDtype(variablestypes_nodes_list),
+                 'temporal': 'category'})
         else:
-            node_results_pd = node_results_pd.assign(
-                PART=[partnames[0]]*len(node_results_pd))
-    else:
-        print('WARNING: temporal_values or variablestypes_nodes_list empty, this probably should not occur')
-
-    times.append(time.process_time())
-    # print('done [took {:5.3f}s]'.format(times[-1] - times[-2])) # don't print this when there's a progressbar
-    print()
-
-    # %%%% set STATE-X
-    print('setting STATE-X groups ... ', end='')
-    for ct_tval, tval in enumerate(analysis_info['temporal_values']):
-        outputfile.setVariableStateInformation(
-            ct_tval, analysis_info['STATENAME_string'], float(tval), float(tval), -1)
-    print('done')
-
-    # %%%% create groups STATE-X/PART
-    print('creating state groups ... ', end='')
-    variables_groups = []
-    for ct_tval in range(len(analysis_info['temporal_values'])):
-        var_group_tval = []
-        for ct_partname in range(len(partnames)):
-            variables_part = outputfile.createVariablesGroup(
-                ct_tval, ct_partname)
-            var_group_tval.append(variables_part)
-        variables_groups.append(var_group_tval)
-    print('done')
-
-    # %%%% nodal
-    times.append(time.process_time())
-    print('writing results ...')
-    if node_results_pd.empty == False:
-        tval_old = -1
-        for ct_tval, tval in enumerate(analysis_info['temporal_values']):
-            if not analysis_info['STATENAME_string'].startswith('NODDIA'):
-                variable_description = 'REAL'
-                myentity = 1
-                print('  time: ', end='')
-            else:
-                # if two "real" mode shapes correspond to the "same" frequency,
-                # the second occurence is chosen to be the imaginary part of
-                # the complex mode shape. frequencies are only approx. equal.
-                if abs(tval-tval_old)/tval < 1e-6:
-                    variable_description = 'IMAGINARY'
-                    myentity = 2
+            print('\nWARNING: temporal_values or variablestypes_nodes_list '
+                  'empty, this probably should not occur')
+
+        timings['assigning nodes to parts'] = time.perf_counter() - time_step
+        print('done')
+        print()
+
+        # %%%% set STATE-X and create groups STATE-X/PART
+        print('setting STATE-X groups and creating state groups ... ', end='')
+        variables_groups = VmapWrite.VmapWriteStates(outputfile,
+                                                     analysis_info,
+                                                     len(partnames))
+        print('done')
+
+        # %%%% nodal
+        time_step = time.perf_counter()
+        print('writing results ...')
+        if node_results_pd.empty == False:
+            # sort once by the keys, s.t. the rows of every (temporal, PART,
+            # variabletype) combination are a contiguous block. instead of
+            # masking the table in each loop, each group is then a slice
+            node_results_order, node_results_groups = \
+                PermasResultsPostprocess.group_rows(
+                    node_results_pd, ['temporal', 'PART', 'variabletype'])
+            # node IDs and values as a single numpy array, the key columns are
+            # only needed for grouping
+            node_values = node_results_pd.drop(
+                columns=['temporal', 'PART', 'variabletype']).to_numpy(
+                    dtype=np.float64)
+            node_values = node_values[node_results_order]
+            # REAL or IMAGINARY part per temporal value, determined once.
+            # for nodal diameter analyses: if two "real" mode shapes correspond
+            # to the "same" frequency, the second occurence is chosen to be the
+            # imaginary part of the complex mode shape. frequencies are only
+            # approx. equal.
+            is_noddia = analysis_info['STATENAME_string'].startswith('NODDIA')
+            tvals = np.asarray(
+                analysis_info['temporal_values'], dtype=np.float64)
+            is_imaginary = np.zeros(tvals.shape[0], dtype=bool)
+            if is_noddia:
+                is_imaginary[1:] = np.abs(np.diff(tvals))/tvals[1:] < 1e-6
+            entities = np.where(is_imaginary, 2, 1).tolist()
+            variable_descriptions = np.where(
+                is_imaginary, 'IMAGINARY', 'REAL').tolist()
+            state_names = ['STATE-' + str(ct_tval)
+                           for ct_tval in range(tvals.shape[0])]
+            for ct_tval, tval in enumerate(analysis_info['temporal_values']):
+                if is_noddia:
+                    print('  ' + variable_descriptions[ct_tval] +
+                          ' part of complex mode with frequency: ', end='')
                 else:
-                    variable_description = 'REAL'
-                    myentity = 1
-                print('  ' + variable_description +
-                      ' part of complex mode with frequency: ', end='')
-            print(str(tval))
-            tval_old = tval
-            node_results_tval_pd = node_results_pd[node_results_pd.temporal ==
-                                                   tval].drop(columns=['temporal'])
-            for ct_partname, partname in enumerate(partnames):
-                print('    part: ' + partname)
-                nodes_results_part_pd = node_results_tval_pd[node_results_tval_pd.PART == partname].drop(columns=[
-                    'PART'])
-                for j in range(len(variablestypes_nodes_list)):
-                    print('      variable: ' + variablestypes_nodes_list[j])
-                    node_results_vartype_pd = nodes_results_part_pd[nodes_results_part_pd.variabletype == variablestypes_nodes_list[j]].drop(columns=[
-                        'variabletype'])
-                    if node_results_vartype_pd.empty:
-                        continue
-                    node_results_vartype_pd = node_results_vartype_pd.dropna(
-                        axis='columns')
-                    VmapWrite.VmapWriteVariables(outputfile,
-                                                 node_results_vartype_pd,
-                                                 result_type=variablestypes_nodes_list[j],
-                                                 state="STATE-"+str(ct_tval),
-                                                 part_id=ct_partname,
-                                                 part_length=parts_numnodes[partname],
-                                                 dimension=node_results_vartype_pd.shape[1]-1,
-                                                 entity=myentity,
-                                                 identifier=j,
-                                                 location=2,
-                                                 description=variable_description,
-                                                 grp=variables_groups[ct_tval][ct_partname])
-    print('done [took {:5.3f}s]'.format(times[-1] - times[-2]))
-else:
-    print('no VARIABLES')
+                    print('  time: ', end='')
+                print(str(tval))
+                for ct_partname, partname in enumerate(partnames):
+                    print('    part: ' + partname)
+                    # arguments that are the same for all variables of the part
+                    write_variable = functools.partial(
+                        VmapWrite.VmapWriteVariables,
+                        outputfile,
+                        state=state_names[ct_tval],
+                        part_id=ct_partname,
+                        part_length=parts_numnodes[partname],
+                        entity=entities[ct_tval],
+                        location=2,
+                        description=variable_descriptions[ct_tval],
+                        grp=variables_groups[ct_tval][ct_partname])
+                    for j in range(len(variablestypes_nodes_list)):
+                        print('      variable: ' + variablestypes_nodes_list[j])
+                        rows = node_results_groups.get(
+                            (tval, partname, variablestypes_nodes_list[j]))
+                        if rows is None:
+                            continue
+                        # only the columns without NaN in this group (node
+                        # ID and its values), checked on the group's slice
+                        node_values_group = node_values[rows]
+                        node_values_vartype = node_values_group[
+                            :, ~np.isnan(node_values_group).any(axis=0)]
+                        write_variable(
+                            node_values_vartype,
+                            result_type=variablestypes_nodes_list[j],
+                            dimension=node_values_vartype.shape[1]-1,
+                            identifier=j)
+        timings['writing results'] = time.perf_counter() - time_step
+        print('done')
+    else:
+        print('no VARIABLES')
 
 # %% finish
 inputfile_model.close()
 inputfile_results.close()
-outputfile.closeFile()
 
-times.append(time.process_time())
-print((aux.sep_small + 'PROCESSTIME FOR EVERYTHING: {:5.3f}s\n' + aux.sep_small)
-      .format(times[-1] - times[0]))
+timings['everything'] = time.perf_counter() - time_start
+print()
+aux.print_timings(timings)
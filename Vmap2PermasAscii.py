@@ -20,11 +20,12 @@ limitations under the License.
 """
 
 from local_imports import sys  # this adds PyVMAP to PATH
-import math
+import itertools
 import time
 import numpy as np
-import pandas as pd
 from func import VmapRead
+from func import VmapReadfunctions as readfunc
+from func import PermasAsciiWrite
 from func import auxiliary as aux
 
 # %% startup
@@ -52,13 +53,17 @@ times.append(time.process_time())
 
 parts, points, elements, material, surface, esets, length_esets, nsets = \
     VmapRead.VmapRead(folder_input + INPUTFILENAME, keyword="model")
+# split the tables once into arrays per element type, part and nset
+points, elements_types, esets_parts, nsets_names = \
+    readfunc.partition_model(points, elements, esets, nsets)
+del elements, esets, nsets
 
 times.append(time.process_time())
 print((aux.sep_small + 'PROCESSTIME FOR READING: {:5.3f}s\n' + aux.sep_small)
       .format(times[-1] - times[-2]))
 
-# %% fill model buffer
-print(aux.sep_big + 'FILL MODEL BUFFER\n' + aux.sep_big)
+# %% write ASCII
+print(aux.sep_big + 'WRITE ASCII FILE\n' + aux.sep_big)
 
 enter_component_string = [
     "$ENTER COMPONENT  NAME = MIXED  DOFTYPE = DISP TEMP"]
@@ -73,237 +78,123 @@ loading_string = ["   $LOADING NAME = MYLOADING", "   $END LOADING"]
 results_string = ["   $RESULTS NAME = MYRESULTS", "   $END RESULTS"]
 exit_component_string = ["$EXIT COMPONENT"]
 
-# model data contains all the strings in correct order which are written into the STRUCTURE part
-model_data = []
-string_Coor = "      $COOR"
-model_data.append(string_Coor)
-
-# print all the coordinates into model_data
-points_tostring = points.drop(columns=["part"]).dropna(axis='columns')
-# add 10 spaces to the dataframe, for right PERMASASCII convention
-empty_string = '          '
-points_tostring.insert(0, 'spaces', empty_string)
-# format values into string
-points_string = points_tostring.to_string(
-    index=False, header=False, float_format='%.6e')
-model_data.append(points_string)
-
-endstring_Coor = "!"
-model_data.append(endstring_Coor)
-
-# %%% elements
-# split the elements back to hexe8 and tet10- elements
-elements_hexe8 = []
-elements_tet10 = []
-
-elements_tet10 = elements[elements.elementtype == 10].drop(
-    columns={'part', 'elementtype'})
-elements_hexe8 = elements[elements.elementtype == 8].drop(
-    columns={'part', 'elementtype'}).dropna(axis='columns')
-
-if len(elements_tet10) != 0:
-    string_Tet10 = "      $ELEMENT TYPE = TET10"
-    model_data.append(string_Tet10)
-
-    # transfrom dataframe to string
-    elements_tet10_tostring = pd.DataFrame(elements_tet10).astype(float)
-    # add 10 spaces to the dataframe, for right PERMASASCII convention
-    empty_string = '          '
-    elements_tet10_tostring.insert(0, 'spaces', empty_string)
-    # format values into string
-    elements_hexe8_string = elements_tet10_tostring.to_string(
-        index=False, header=False, float_format='%.0f')
-    model_data.append(elements_hexe8_string)
-
-if len(elements_hexe8) != 0:
-    string_Hexe8 = "      $ELEMENT TYPE = HEXE8"
-    model_data.append(string_Hexe8)
-
-    # transfrom dataframe to string
-    elements_hexe8_tostring = pd.DataFrame(elements_hexe8).astype(float)
-    # add 10 spaces to the dataframe, for right PERMASASCII convention
-    empty_string = '          '
-    elements_hexe8_tostring.insert(0, 'spaces', empty_string)
-    # format values into string
-    elements_tet10_string = elements_hexe8_tostring.to_string(
-        index=False, header=False, float_format='%.0f')
-    model_data.append(elements_tet10_string)
-
-# %%% element sets
-divider = 14
-for i in range(len(parts)):
-    # add ESET Name
-    eset_string = "      $ESET NAME = %s" % (parts[i][1])
-    model_data.append(eset_string)
-
-    # seperate esets from the current part and take only the element numbers
-    esets_part = esets[esets.part == parts[i][1]]
-    esets_part_np = np.array(esets_part.element)
-
-    # split the nsets in nsets with full rows and the last row
-    number_of_full_rows = math.floor(esets_part_np.shape[0]/divider)
-    esets_to_resize = esets_part_np[:number_of_full_rows*divider]
-    esets_not_to_resize = esets_part_np[number_of_full_rows*divider:]
-
-    if len(esets_to_resize) != 0:
-        # FULL ROWS
-        # new shape for nsets (here 14 in one row)
-        esets_to_resize = np.resize(
-            esets_to_resize, (number_of_full_rows, divider))
-        # insert spaces only works for pandas Dataframes
-        esets_resized_pd = pd.DataFrame(esets_to_resize)
-        # add 10 spaces to the dataframe, for right PERMASASCII convention
-        empty_string = '          '
-        esets_resized_pd.insert(0, 'spaces', empty_string)
-        # format values into string
-        esets_resized_string = esets_resized_pd.to_string(
-            index=False, header=False, float_format='%.0f')
-        model_data.append(esets_resized_string)
-    if len(esets_not_to_resize) != 0:
-        # LAST ROW
-        # insert spaces only works for pandas Dataframes
-        esets_not_resized_pd = pd.DataFrame([esets_not_to_resize])
-        # add 10 spaces to the dataframe, for right PERMASASCII convention
-        esets_not_resized_pd.insert(0, 'spaces', empty_string)
-        # format values into string
-        esets_not_resized_string = esets_not_resized_pd.to_string(
-            index=False, header=False, float_format='%.0f')
-        model_data.append(esets_not_resized_string)
-
-# %%% nodal sets
-if nsets.empty != True:
-    name_nsets = sorted(list(set(nsets.NAME)))
-    for i in range(len(name_nsets)):
-        # add NSET Name
-        nset_string = "      $NSET NAME = %s" % (name_nsets[i])
-        model_data.append(nset_string)
-
-        # seperate nsets from the current nset and take only the node numbers
-        nsets_part = nsets[nsets.NAME == name_nsets[i]]
-        nsets_part_np = np.array(nsets_part[0])
+fin_string = ['$FIN']
+material_start_string = ["$ENTER MATERIAL"]
+material_end_string = ["$EXIT MATERIAL"]
+
+# the constant blocks are joined once into the text written before and after
+# the STRUCTURE data, respectively
+component_start_text = '\n'.join(
+    enter_component_string + structure_start_string) + '\n'
+component_end_text = '\n'.join(
+    structure_end_string + constraints_string + system_string +
+    loading_string + results_string + situation_string +
+    exit_component_string) + '\n'
+material_start_text = '\n'.join(material_start_string) + '\n'
+material_end_text = '\n'.join(material_end_string) + '\n'
+fin_text = '\n'.join(fin_string) + '\n'
 
-        # split the nsets in nsets with full rows and the last row
-        number_of_full_rows = math.floor(nsets_part_np.shape[0]/divider)
-        nsets_to_resize = nsets_part_np[:number_of_full_rows*divider]
-        nsets_not_to_resize = nsets_part_np[number_of_full_rows*divider:]
+# data.post(HyperView) or data.dat(Hypermesh)
+# each block is written as soon as it is formatted, through a large buffer
+with open(folder_output + OUTPUTFILENAME, 'w', buffering=1048576) as f:
+    # enter component, start structure
+    f.write(component_start_text)
+
+    # %%% coordinates
+    # the strings are written in correct order into the STRUCTURE part
+    string_Coor = "      $COOR"
+    f.write(string_Coor + '\n')
+
+    # write all the coordinates, formatted with one row format per node
+    np.savetxt(f, points,
+               fmt='          %10d %13.6e %13.6e %13.6e')
+
+    endstring_Coor = "!"
+    f.write(endstring_Coor + '\n')
+
+    # %%% elements
+    # tet10 and hexe8 elements, identified by their number of nodes
+    elements_names = {10: 'TET10', 8: 'HEXE8'}
+    for numnodes, elementtype in elements_names.items():
+        if numnodes not in elements_types:
+            continue
+        string_Element = "      $ELEMENT TYPE = %s" % elementtype
+        f.write(string_Element + '\n')
+
+        # format values into string, connectivity is integer
+        elements_type_string = PermasAsciiWrite.format_matrix(
+            elements_types[numnodes], '%10d')
+        f.write(elements_type_string + '\n')
+
+    # %%% element sets
+    # the sets are formatted one after the other in this process. worker
+    # processes would not pay off for the vectorized integer formatting, and
+    # on platforms without fork, spawned workers would re-run this script
+    divider = 14
+    for part in parts:
+        # add ESET Name
+        eset_string = "      $ESET NAME = %s" % (part[1])
+        f.write(eset_string + '\n')
+        # format values into strings, 14 in one row
+        esets_part_string = PermasAsciiWrite.format_wrapped(
+            esets_parts.get(part[1], np.empty(0, dtype=np.int64)), '%8d',
+            divider)
+        if esets_part_string:
+            f.write(esets_part_string + '\n')
+
+    # %%% nodal sets
+    if len(nsets_names) != 0:
+        for name_nset, nset in nsets_names.items():
+            # add NSET Name
+            nset_string = "      $NSET NAME = %s" % (name_nset)
+            f.write(nset_string + '\n')
+            # format values into strings, 14 in one row
+            nsets_part_string = PermasAsciiWrite.format_wrapped(
+                nset, '%8d', divider)
+            if nsets_part_string:
+                f.write(nsets_part_string + '\n')
+
+    # %%% surfaces
+    if surface.empty != True:
+        # partition the surfaces by name in a single pass, in order of
+        # appearance
+        for name, surface_part in surface.groupby('NAME', sort=False):
+            surface_string = \
+                "      $SURFACE ELEMENTS  SURFID = %s  SFSET = %s" % \
+                (name.split('_')[-1], '_'.join(name.split('_')[:-1]))
+            f.write(surface_string + '\n')
 
-        if len(nsets_to_resize) != 0:
-            # FULL ROWS
-            # new shape for nsets (here 14 in one row)
-            nsets_to_resize = np.resize(
-                nsets_to_resize, (number_of_full_rows, divider))
-            # insert spaces only works for pandas Dataframes
-            nsets_resized_pd = pd.DataFrame(nsets_to_resize)
-            # add 10 spaces to the dataframe, for right PERMASASCII convention
-            empty_string = '          '
-            nsets_resized_pd.insert(0, 'spaces', empty_string)
-            # format values into string
-            nsets_resized_string = nsets_resized_pd.to_string(
-                index=False, header=False, float_format='%.0f')
-            model_data.append(nsets_resized_string)
-        if len(nsets_not_to_resize) != 0:
-            # LAST ROW
-            # insert spaces only works for pandas Dataframes
-            nsets_not_resized_pd = pd.DataFrame([nsets_not_to_resize])
-            # add 10 spaces to the dataframe, for right PERMASASCII convention
-            nsets_not_resized_pd.insert(0, 'spaces', empty_string)
             # format values into string
-            nsets_not_resized_string = nsets_not_resized_pd.to_string(
-                index=False, header=False, float_format='%.0f')
-            model_data.append(nsets_not_resized_string)
-
-# %%% surfaces
-if surface.empty != True:
-    surface_names = list(surface["NAME"].drop_duplicates())
-
-    for name in surface_names:
-        surface_string = "      $SURFACE ELEMENTS  SURFID = %s  SFSET = %s" % \
-            (name.split('_')[-1], '_'.join(name.split('_')[:-1]))
-        model_data.append(surface_string)
-
-        surface_part = surface[surface['NAME'] == name].drop(columns=["NAME"])\
-            .astype('int32')
-        # add 10 spaces to the dataframe, for right PERMASASCII convention
-        empty_string = '          '
-        surface_part.insert(0, 'spaces', empty_string)
-        # format values into string
-        surface_part_string = surface_part.to_string(
-            index=False, header=False, float_format='%.0f')
-        model_data.append(surface_part_string)
-
-
-# %%% material
-if material.empty != True:
-    material = material.set_axis(list(range(material.shape[1])), axis=1)
-    # Material
-    material_start_string = ["$ENTER MATERIAL"]
-    material_end_string = ["$EXIT MATERIAL"]
-
-    material_string = []
-    for i in range(material.shape[1]):
-        material_string.extend(["   $MATERIAL  NAME = %s TYPE = ISO" % material.iloc[0][i],
-                                "      $ELASTIC  GENERAL  INPUT = DATA",
-                                "        %s  %s" % (
-                                    material.iloc[1][i], material.iloc[2][i])])
-        for j in range(material.shape[0]-3):
-            material_string.extend(["      $%s  GENERAL  INPUT = DATA" % material.index[3+j],
-                                    "        %s" % material.iloc[3+j][i]])
-
-        material_string.extend(["   $END MATERIAL"])
+            surface_part_string = PermasAsciiWrite.format_matrix(
+                surface_part.drop(columns=["NAME"]).to_numpy(dtype=np.int32),
+                '%10d')
+            f.write(surface_part_string + '\n')
+
+    # end structure, empty constraints, system, loading, results, situation
+    f.write(component_end_text)
+
+    # %%% material
+    if material.empty != True:
+        # one column per material: name, modulus, poisson, further parameters
+        parameter_headers = ["      $%s  GENERAL  INPUT = DATA" % parameter
+                             for parameter in material.index[3:]]
+        material_string = []
+        for values in material.to_numpy(dtype=object).T.tolist():
+            material_string += [
+                "   $MATERIAL  NAME = %s TYPE = ISO" % values[0],
+                "      $ELASTIC  GENERAL  INPUT = DATA",
+                "        %s  %s" % (values[1], values[2])]
+            material_string += itertools.chain.from_iterable(
+                (header, "        %s" % value)
+                for header, value in zip(parameter_headers, values[3:]))
+            material_string.append("   $END MATERIAL")
+
+        f.write(material_start_text)
+        f.writelines(line + '\n' for line in material_string)
+        f.write(material_end_text)
 
-fin_string = ['$FIN']
-
-times.append(time.process_time())
-print((aux.sep_small + 'PROCESSTIME FOR MODEL BUFFER STRINGS: {:5.3f}s\n' + aux.sep_small)
-      .format(times[-1] - times[-2]))
-
-# %% write ASCII
-print(aux.sep_big + 'WRITE ASCII FILE\n' + aux.sep_big)
-# data.post(HyperView) or data.dat(Hypermesh)
-with open(folder_output + OUTPUTFILENAME, 'w+') as f:
-    # enter component
-    for i in range(len(enter_component_string)):
-        f.write('%s\n' % enter_component_string[i])
-    # start structure
-    for i in range(len(structure_start_string)):
-        f.write('%s\n' % structure_start_string[i])
-    # model data:
-    for i in range(len(model_data)):
-        f.write('%s\n' % model_data[i])
-    # end structure
-    for i in range(len(structure_end_string)):
-        f.write('%s\n' % structure_end_string[i])
-    # Constraints (empty)
-    for i in range(len(constraints_string)):
-        f.write('%s\n' % constraints_string[i])
-    # System (empty)
-    for i in range(len(system_string)):
-        f.write('%s\n' % system_string[i])
-    # Loading (empty)
-    for i in range(len(loading_string)):
-        f.write('%s\n' % loading_string[i])
-    # Results (empty)
-    for i in range(len(results_string)):
-        f.write('%s\n' % results_string[i])
-    # Situation (empty)
-    for i in range(len(situation_string)):
-        f.write('%s\n' % situation_string[i])
-    # exit component
-    for i in range(len(exit_component_string)):
-        f.write('%s\n' % exit_component_string[i])
-    if material.empty == False:
-        # start material
-        for i in range(len(material_start_string)):
-            f.write('%s\n' % material_start_string[i])
-        material
-        for i in range(len(material_string)):
-            f.write('%s\n' % material_string[i])
-        # end material
-        for i in range(len(material_end_string)):
-            f.write('%s\n' % material_end_string[i])
     # fin
-    for i in range(len(fin_string)):
-        f.write('%s\n' % fin_string[i])
+    f.write(fin_text)
 
 times.append(time.process_time())
 print((aux.sep_small + 'PROCESSTIME FOR EVERYTHING: {:5.3f}s\n' + aux.sep_small)
@@ -0,0 +1,146 @@
+"""
+Functions for writing Permas-ASCII.
+
+Formatting the model data read from VMAP into the text blocks of a
+Permas-ASCII file.
+
+Copyright 2022 German Aerospace Center (DLR e.V.)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import re
+
+
+def format_matrix(arr, fmt, leading_spaces=10):
+    """
+    Format a matrix into Permas-ASCII data lines, one line per row.
+
+    Parameters
+    ----------
+    arr : np.array
+        num-rows x num-cols, values to be formatted.
+    fmt : string or list of strings
+        printf-style format, either for all columns or one per column.
+    leading_spaces : int, optional
+        Number of blanks in front of each line. The default is 10, which is
+        the Permas-ASCII convention for data lines.
+
+    Returns
+    -------
+    lines : string
+        Formatted rows separated by newlines, without trailing newline.
+
+    """
+    if isinstance(fmt, str):
+        fmt = [fmt] * arr.shape[1]
+    rows = np.char.mod(fmt[0], arr[:, 0])
+    for fmt_col, col in zip(fmt[1:], arr.T[1:]):
+        rows = np.char.add(np.char.add(rows, ' '), np.char.mod(fmt_col, col))
+    # leading blanks are prepended once to the complete rows
+    lines = '\n'.join(np.char.add(' ' * leading_spaces, rows).tolist())
+    return lines
+
+
+def format_wrapped(arr, fmt, divider=14, leading_spaces=10):
+    """
+    Format a vector into Permas-ASCII data lines with a fixed number of items.
+
+    Parameters
+    ----------
+    arr : np.array
+        1D, values to be formatted, e.g. the indices of a set.
+    fmt : string
+        printf-style format for all values.
+    divider : int, optional
+        Number of values per line. The last line may be shorter. The default
+        is 14.
+    leading_spaces : int, optional
+        Number of blanks in front of each line. The default is 10.
+
+    Returns
+    -------
+    lines : string
+        Formatted lines separated by newlines, without trailing newline.
+
+    """
+    # right-aligned integers of fixed width are written digit by digit
+    fmt_int = re.fullmatch(r'%(\d+)d', fmt)
+    if fmt_int is not None and np.issubdtype(arr.dtype, np.integer) \
+            and leading_spaces > 0 and arr.size > 0 \
+            and arr.min() >= 0 and arr.max() < 10**int(fmt_int.group(1)):
+        return format_wrapped_int(arr, int(fmt_int.group(1)), divider,
+                                  leading_spaces)
+    num_full = arr.size - arr.size % divider
+    blocks = []
+    if num_full > 0:
+        # FULL ROWS
+        blocks.append(format_matrix(arr[:num_full].reshape(-1, divider), fmt,
+                                    leading_spaces))
+    if num_full < arr.size:
+        # LAST ROW
+        blocks.append(format_matrix(arr[np.newaxis, num_full:], fmt,
+                                    leading_spaces))
+    lines = '\n'.join(blocks)
+    return lines
+
+
+def format_wrapped_int(arr, width, divider=14, leading_spaces=10):
+    """
+    Format non-negative integers like format_wrapped with format '%<width>d'.
+
+    The ASCII digits are computed with integer arithmetic on the whole array
+    and written into a byte buffer, one digit position at a time. Hence,
+    there is no Python string per value.
+
+    Parameters
+    ----------
+    arr : np.array of int
+        1D, non-empty, values between 0 and 10**width - 1.
+    width : int
+        Field width of each value.
+    divider : int, optional
+        Number of values per line. The default is 14.
+    leading_spaces : int, optional
+        Number of blanks in front of each line, at least 1. The default is 10.
+
+    Returns
+    -------
+    lines : string
+        Formatted lines separated by newlines, without trailing newline.
+
+    """
+    num_rows = -(-arr.size // divider)
+    # pad the last row, padded fields are cut off below
+    values = np.zeros(num_rows*divider, dtype=np.int64)
+    values[:arr.size] = arr
+    # each field is a separating blank and width characters
+    fields = np.full((num_rows*divider, 1 + width), ord(' '), dtype=np.uint8)
+    remainder = values.copy()
+    for ct_digit in range(width):
+        # leading zeros are blanks, but a zero value has one digit
+        is_digit = (remainder > 0) if ct_digit > 0 \
+            else np.ones(values.size, dtype=bool)
+        fields[is_digit, width - ct_digit] = ord('0') + remainder[is_digit] % 10
+        remainder //= 10
+    # rows: leading blanks (the first is the first field's separator), fields
+    buffer = np.full((num_rows, leading_spaces - 1 + divider*(1 + width) + 1),
+                     ord(' '), dtype=np.uint8)
+    buffer[:, leading_spaces-1:-1] = fields.reshape(num_rows, -1)
+    buffer[:, -1] = ord('\n')
+    # the last row ends after its last value
+    length = num_rows*buffer.shape[1] - \
+        (num_rows*divider - arr.size)*(1 + width) - 1
+    lines = buffer.tobytes()[:length].decode('ascii')
+    return lines
@@ -16,12 +16,236 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import h5py
 import numpy as np
 import pandas as pd
+import re
 import sys
 
+# define implemented PERMAS analysis types (keys) and the correspopnding
+# VMAP STATE attributes (values). there are two temporal categories:
+# first category 'temporal': VMAP time attributes denote time quantities [t]
+availableanalyses_temporal = {'STATIC': 'STATIC_LINEAR',
+                              'NLMATERIAL': 'STATIC_NONLINEAR',
+                              'TEMPERATURE': 'STATIC_LINEAR',
+                              'NLTEMP': 'STATIC_NONLINEAR',
+                              'DIRECT TEMPERATURE': 'TRANSIENT_LINEAR',
+                              'DIRECT NLTEMP': 'TRANSIENT_NONLINEAR'}
+# second category 'modal': VMAP time attribute denote frequencies [1/t]
+availableanalyses_modal = {'VIBRATION ANALYSIS': 'MODAL'}
+# all analyses (concatenated dictionaries)
+availableanalyses_all = {**availableanalyses_temporal,
+                         **availableanalyses_modal}
+# matches the analysis type at the beginning of .Analysis. the alternatives
+# are sorted by descending length, s.t. the longest prefix wins
+availableanalyses_regex = re.compile('|'.join(
+    re.escape(analysis) for analysis in
+    sorted(availableanalyses_all, key=len, reverse=True)))
 
-def PermasHdfRead(openfile, keyword, variable_keyword='NONE'):
+
+def set_metadata_cache(openfile, mdc_nbytes=32*1024**2):
+    """
+    Start the metadata cache of an open HDF5 file with a given size.
+
+    HDF5 starts with a 2 MiB metadata cache and enlarges it adaptively. For
+    files with many groups and chunked datasets, the B-tree nodes are evicted
+    and re-read until then. The adaptive resizing and eviction stay enabled.
+
+    Parameters
+    ----------
+    openfile : open h5py file
+    mdc_nbytes : int, optional
+        Initial size of the metadata cache in bytes. The default is 32 MiB,
+        which is HDF5's default maximum size.
+
+    Returns
+    -------
+    None.
+
+    """
+    mdc_config = openfile.id.get_mdc_config()
+    mdc_config.max_size = max(mdc_config.max_size, mdc_nbytes)
+    mdc_config.set_initial_size = True
+    mdc_config.initial_size = mdc_nbytes
+    openfile.id.set_mdc_config(mdc_config)
+    return
+
+
+def open_permas_hdf(filename, rdcc_nbytes=64*1024**2, chunks_cached=16,
+                    rdcc_nbytes_max=256*1024**2):
+    """
+    Open a Permas-HDF file for reading with tuned raw data and metadata caches.
+
+    h5py's default cache of 1 MiB causes chunks to be re-read repeatedly if
+    they do not fit into it. The cache is therefore enlarged to hold at least
+    chunks_cached chunks of the dataset with the largest chunks in the file,
+    up to rdcc_nbytes_max. A larger cache would not pay off, since each
+    dataset is read whole by a single H5Dread. The number of hash slots is
+    sized for the smallest chunks, s.t. a full cache does not evict chunks due
+    to hash collisions. The metadata cache is enlarged by set_metadata_cache.
+
+    Parameters
+    ----------
+    filename : string
+    rdcc_nbytes : int, optional
+        Minimum size of the chunk cache in bytes. The default is 64 MiB.
+    chunks_cached : int, optional
+        Number of largest chunks the cache has to hold. The default is 16.
+    rdcc_nbytes_max : int, optional
+        Maximum size of the chunk cache in bytes. The default is 256 MiB.
+
+    Returns
+    -------
+    openfile : open h5py file
+
+    """
+    # the number of slots should be a prime number, ~10x the number of chunks
+    # held by the cache
+    hdf_chunk_cache = {'rdcc_nbytes': rdcc_nbytes,
+                       'rdcc_nslots': 10007,
+                       'rdcc_w0': 0.75}
+    openfile = h5py.File(filename, 'r', **hdf_chunk_cache)
+    set_metadata_cache(openfile)
+
+    # sizes of the chunks of all datasets, only metadata is read
+    chunk_nbytes = []
+
+    def collect_chunk_nbytes(name, obj):
+        if isinstance(obj, h5py.Dataset) and obj.chunks is not None:
+            chunk_nbytes.append(int(np.prod(obj.chunks)) * obj.dtype.itemsize)
+
+    openfile.visititems(collect_chunk_nbytes)
+    if len(chunk_nbytes) == 0:
+        return openfile
+    nbytes = min(max(rdcc_nbytes, max(chunk_nbytes) * chunks_cached),
+                 max(rdcc_nbytes, rdcc_nbytes_max))
+    # smallest prime above 10x the number of smallest chunks the cache holds,
+    # limited to ~1e6 slots (8 MB of hash table)
+    nslots = min(max(10 * nbytes // max(min(chunk_nbytes), 1), 10007),
+                 1000003)
+    while any(nslots % divisor == 0
+              for divisor in range(2, int(nslots**0.5) + 1)):
+        nslots += 1
+    # re-open only if the size changes or the number of slots by more than a
+    # factor of 2, a slightly different number of slots is not worth it
+    if nbytes != hdf_chunk_cache['rdcc_nbytes'] \
+            or not hdf_chunk_cache['rdcc_nslots'] / 2 <= nslots \
+            <= 2 * hdf_chunk_cache['rdcc_nslots']:
+        # the cache size is fixed when opening, hence re-open
+        openfile.close()
+        hdf_chunk_cache['rdcc_nbytes'] = nbytes
+        hdf_chunk_cache['rdcc_nslots'] = nslots
+        openfile = h5py.File(filename, 'r', **hdf_chunk_cache)
+        set_metadata_cache(openfile)
+    return openfile
+
+
+def read_dataset(dataset, array=None):
+    """
+    Read a complete HDF5 dataset into a preallocated numpy array.
+
+    The dataset is read with a single low-level H5Dread of the whole dataset
+    into the whole array. This avoids the additional allocation and copy of
+    np.array(dataset), which is significant for chunked datasets, as well as
+    the selection handling of h5py's high-level reads.
+
+    Parameters
+    ----------
+    dataset : h5py dataset
+    array : np.array, optional
+        C-contiguous array of the same shape as dataset, e.g. a slab of a
+        larger array. The default is None, i.e. a new array is allocated.
+
+    Returns
+    -------
+    array : np.array
+        Same shape and dtype as dataset, if not given.
+
+    """
+    if array is None:
+        array = np.empty(dataset.shape, dtype=dataset.dtype)
+    elif array.shape != dataset.shape or not array.flags['C_CONTIGUOUS']:
+        # HDF5 writes the complete dataset into the buffer, which must fit
+        raise ValueError('cannot read dataset of shape ' + str(dataset.shape) +
+                         ' into array of shape ' + str(array.shape))
+    if array.size > 0:
+        dataset.id.read(h5py.h5s.ALL, h5py.h5s.ALL, array)
+    return array
+
+
+def read_analysis(situation, situation_path):
+    """
+    Read the analysis type of a situation, and its nodal diameter if modal.
+
+    Parameters
+    ----------
+    situation : h5py group
+    situation_path : string
+        Path of the situation for messages.
+
+    Returns
+    -------
+    analysis_type : string
+        Key of availableanalyses_all.
+    MNODDIA : float
+        Modal diameter number, -1 if not applicable or not found.
+
+    """
+    MNODDIA = -1
+    try:
+        print('  reading ' + situation_path +
+              '/.Analysis', flush=True)
+        # decode explicitly, the encoding of stdout depends on
+        # the locale and on redirection. asstr() needs h5py>=3.
+        # a scalar variable-length string dataset is read as str,
+        # a scalar fixed-length one as bytes or np.bytes_, and an
+        # array of characters or strings as np.array
+        analysis_value = situation['.Analysis'][()]
+        if isinstance(analysis_value, str):
+            analysis_type = analysis_value
+        else:
+            analysis_type = np.asarray(analysis_value).tobytes().decode(
+                'UTF-8', errors='replace')
+        analysis_type = analysis_type.strip(' \x00')
+        # the comparison is by prefix due to using h5py 2.10 which is bad at reading strings
+        match = availableanalyses_regex.match(analysis_type)
+        if match is not None:
+            analysis_type = match.group()
+            print('  analysis: ' + analysis_type)
+        else:
+            print('ERROR: analysis type ' + analysis_type +
+                  'not available! Available analysis types: ', end='')
+            print(availableanalyses_all.keys())
+            sys.exit(1)
+        # try to find nodal diameter information in .Model. If .Model is not available or does not contain $PARAMETER with keyword MNODDIA, then we assume it is not a nodal diameter analysis.
+        if analysis_type == 'VIBRATION ANALYSIS':
+            print('    trying to find keyword MNODDIA in $PARAMETER block '
+                  'of .Model dataset ...')
+            try:
+                # one line per entry, joined without decoding
+                model_bytes = b'\n'.join(
+                    situation['.Model'][()].tolist())
+            except:
+                print('      no model found')
+                model_bytes = b''
+            # the value is the last item of the line
+            match = re.search(
+                rb'^      MNODDIA.*?(\S+)[ \t]*$', model_bytes, re.M)
+            if match is not None:
+                MNODDIA = float(match.group(1))
+            if MNODDIA != -1:
+                print('      found MNODDIA = ' + str(MNODDIA))
+            else:
+                print('      could not find MNODDIA')
+            print('    ... done')
+    except:
+        print('ERROR: no analysis found.')
+        sys.exit(1)
+    return analysis_type, MNODDIA
+
+
+def PermasHdfRead(openfile, keyword, variable_keyword='NONE',
+                  analysis_cache=None):
     """
     Read dataset(s) from Permas-HDF.
 
@@ -42,6 +266,11 @@ def PermasHdfRead(openfile, keyword, variable_keyword='NONE'):
         'node_results': read result dataset depending on variable_keyword
     variable_keyword : string, optional
         Name of Permas result quantity. The default is 'NONE'.
+    analysis_cache : dictionary, optional
+        Analysis type and modal diameter number of the situations read so far,
+        keys are the paths of the situations. Filled by this function, s.t.
+        further variables of the same file reuse them. The default is None,
+        i.e. they are read for every call.
 
     Returns
     -------
@@ -52,72 +281,58 @@ def PermasHdfRead(openfile, keyword, variable_keyword='NONE'):
         'STATENAME_string' : 'LINEAR' or 'NONLINEAR' or 'MODAL' or 'NODDIA_X'
         'temporal_type' : 'timesteps' or 'frequencies'
         'temporal_values' : list of floats
-    HdfData : Pandas dataframe
+    HdfData : h5py dataset or Pandas dataframe
+        keyword == 'model': the dataset .Model.
+        keyword == 'node_results': one row per node and temporal value, built
+        in one piece from all ColumnN datasets (no concatenation). Cols: node,
+        temporal, variabletype, result values 0, 1, ... Empty if the
+        requested result is not available.
 
     """
     if (keyword != 'node_results') and (keyword != 'model'):
         print('ERROR: keyword ' + keyword + 'does not exist!')
         sys.exit(1)
 
-    # define implemented PERMAS analysis types (keys) and the correspopnding
-    # VMAP STATE attributes (values). there are two temporal categories:
-    # first category 'temporal': VMAP time attributes denote time quantities [t]
-    availableanalyses_temporal = {'STATIC': 'STATIC_LINEAR',
-                                  'NLMATERIAL': 'STATIC_NONLINEAR',
-                                  'TEMPERATURE': 'STATIC_LINEAR',
-                                  'NLTEMP': 'STATIC_NONLINEAR',
-                                  'DIRECT TEMPERATURE': 'TRANSIENT_LINEAR',
-                                  'DIRECT NLTEMP': 'TRANSIENT_NONLINEAR'}
-    # second category 'modal': VMAP time attribute denote frequencies [1/t]
-    availableanalyses_modal = {'VIBRATION ANALYSIS': 'MODAL'}
-    # all analyses (concatenated dictionaries)
-    availableanalyses_all = {**availableanalyses_temporal,
-                             **availableanalyses_modal}
-
     # analysis information. actually there is one per situation, but only one situation is considered
     analysis_info = {}
-    # modal diameter number, if applicable
-    MNODDIA = -1
 
-    # return container
-    HdfData = pd.DataFrame([])
+    # return container, assigned once the data is read
+    HdfData = None
+
+    # file name for messages, h5py queries it from HDF5 on every access
+    filename = openfile.filename
 
     # COMPONENT
     ct_component = 0
-    for component_str in openfile:
-        # read out types of components with .keys
-        # component = list(openfile.keys())[i]
-        # ignore dataset .File Header
-        if component_str.startswith('.'):
-            continue
-        else:
-            print('  component: ' + component_str)
-            component = openfile[component_str]
-            ct_component += 1
-        # only one component can be considered
+    # ignore objects starting with a dot (.), e.g. dataset .File Header. the
+    # filter is lazy, s.t. the loop can stop early
+    components_str = (key for key in openfile if not key.startswith('.'))
+    for component_str in components_str:
+        ct_component += 1
+        # only one component can be considered, stop at the second one
         if ct_component > 1:
             print('WARNING: only one component possible, skipping '
-                  + component_str + '.')
-            continue
+                  + component_str + ' and any further.')
+            break
+        print('  component: ' + component_str)
+        component = openfile[component_str]
+        component_path = filename + '/' + component_str
 
         # SITUATION
         ct_situation = 0
-        for situation_str in component:
-            if situation_str.startswith('.'):
-                # if object starts with a dot (.), it is not a situation
-                continue
-            else:
-                print('  situation: ' + situation_str)
-                situation_path = openfile.filename + '/' + component_str + \
-                    '/' + situation_str
-                situation = component[situation_str]
-                ct_situation += 1
-                variable_path = situation_path + '/' + variable_keyword
-            # only one situation can be considered
+        # if object starts with a dot (.), it is not a situation
+        situations_str = (key for key in component if not key.startswith('.'))
+        for situation_str in situations_str:
+            ct_situation += 1
+            # only one situation can be considered, stop at the second one
             if ct_situation > 1:
                 print('WARNING: only one situation possible, skipping '
-                      + situation_str + '.')
-                continue
+                      + situation_str + ' and any further.')
+                break
+            print('  situation: ' + situation_str)
+            situation_path = component_path + '/' + situation_str
+            situation = component[situation_str]
+            variable_path = situation_path + '/' + variable_keyword
 
             # MODEL
             if keyword == 'model':
@@ -139,81 +354,65 @@ def PermasHdfRead(openfile, keyword, variable_keyword='NONE'):
                     print('  NOTE: requested result keyword ' +
                           variable_keyword + ' not found.')
                     break
-                # type of analysis
-                try:
-                    print('  reading ' + situation_path +
-                          '/.Analysis', flush=True)
-                    analysis_type = str(
-                        situation['.Analysis'][:], sys.stdout.encoding).strip()
-                    # the following comparisons are cumbersome due to using h5py 2.10 which is bad at reading strings
-                    found_analysis_type = False
-                    for availableanalysis in availableanalyses_all.keys():
-                        if analysis_type.startswith(availableanalysis):
-                            analysis_type = availableanalysis
-                            if not found_analysis_type:
-                                print('  analysis: ' + analysis_type)
-                            else:
-                                print(
-                                    'WARNING: found analysis type before, something might be wrong')
-                            found_analysis_type = True
-                    if not found_analysis_type:
-                        print('ERROR: analysis type ' + analysis_type +
-                              'not available! Available analysis types: ', end='')
-                        print(availableanalyses_all.keys())
-                        sys.exit(1)
-                    # try to find nodal diameter information in .Model. If .Model is not available or does not contain $PARAMETER with keyword MNODDIA, then we assume it is not a nodal diameter analysis.
-                    if analysis_type == 'VIBRATION ANALYSIS':
-                        print(
-                            '    trying to find keyword MNODDIA in $PARAMETER block of .Model dataset ...')
-                        try:
-                            model_list = list(np.char.decode(
-                                situation['.Model'], encoding='UTF-8'))
-                        except:
-                            print('      no model found')
-                            model_list = []
-                        for line in model_list:
-                            if line.startswith('      MNODDIA'):
-                                MNODDIA = float(line.strip().split()[-1])
-                                break
-                        if MNODDIA != -1:
-                            print('      found MNODDIA = ' + str(MNODDIA))
-                        else:
-                            print('      could not find MNODDIA')
-                        print('    ... done')
-                except:
-                    print('ERROR: no analysis found.')
-                    sys.exit(1)
+                # type of analysis, read once per situation if cached.
+                # further variables of the same situation reuse it
+                if analysis_cache is None:
+                    analysis_type, MNODDIA = read_analysis(
+                        situation, situation_path)
+                else:
+                    if situation_path not in analysis_cache:
+                        analysis_cache[situation_path] = read_analysis(
+                            situation, situation_path)
+                    analysis_type, MNODDIA = analysis_cache[situation_path]
                 # read .ColDes
                 try:
-                    col_des = np.array(result_group['.ColDes'])
+                    col_des = read_dataset(result_group['.ColDes'])
                 except:
-                    print('ERROR: no dataset ' + situation_path +
-                          '/' + variable_keyword + '/.ColDes')
+                    print('ERROR: no dataset ' + variable_path + '/.ColDes')
                     sys.exit(1)
                 # read .RowDes
                 try:
-                    row_des = np.array(result_group['.RowDes'])
+                    row_des = read_dataset(result_group['.RowDes'])
                 except:
                     print('ERROR: no dataset ' + variable_path + '/.RowDes')
                     sys.exit(1)
-                # read Column1, Column2, etc and append to HdfData
-                col_vals = []
-                for ct_col, col_des_val in enumerate(col_des):
+                # read Column1, Column2, etc one below the other into a single
+                # array, allocated when the shape of the first column is known.
+                # the values are converted to float64 by HDF5 while reading,
+                # which is the type they are processed and written with
+                num_rows = row_des.shape[0]
+                num_cols = len(col_des)
+                col_keys = ['Column' + str(ct_col+1)
+                            for ct_col in range(num_cols)]
+                col_vals = None
+                # one line for all columns, there may be thousands of them
+                print('  reading ' + variable_path + '/Column1 ... Column' +
+                      str(num_cols), flush=True)
+                for ct_col, col_key in enumerate(col_keys):
                     try:
-                        print('  reading ' + variable_path +
-                              '/Column' + str(ct_col+1), flush=True)
-                        col_vals.append(pd.DataFrame(
-                            np.array(result_group['Column' + str(ct_col+1)])))
-                        # add auxiliary columns.
-                        # column 'temporal' contains either timestep or frequency,
-                        # repeated for every row (i.e. node)
-                        col_vals[-1].insert(0, 'node', row_des)
-                        col_vals[-1].insert(1, 'temporal', col_des_val)
-                        col_vals[-1].insert(2, 'variabletype', variable_keyword)
+                        column = result_group[col_key]
+                        if col_vals is None:
+                            col_vals = np.empty(
+                                (num_cols*num_rows,) + column.shape[1:],
+                                dtype=np.float64)
+                        read_dataset(column, col_vals[
+                            ct_col*num_rows:(ct_col+1)*num_rows])
+                    except ValueError as error:
+                        # all columns must have the shape of Column1
+                        print('ERROR: ' + variable_path + '/' + col_key +
+                              ': ' + str(error))
+                        sys.exit(1)
                     except:
-                        print('ERROR: cannot open column')
+                        print('ERROR: cannot open column ' + variable_path +
+                              '/' + col_key)
                         sys.exit(1)
-                HdfData = pd.concat(col_vals, axis=0)
+                HdfData = pd.DataFrame(col_vals, copy=False)
+                # add auxiliary columns.
+                # column 'temporal' contains either timestep or frequency,
+                # repeated for every row (i.e. node)
+                HdfData.insert(0, 'node', np.tile(row_des, num_cols))
+                HdfData.insert(1, 'temporal', np.repeat(col_des, num_rows))
+                HdfData.insert(2, 'variabletype', variable_keyword)
                 # assemble analysis_info dictionary
                 analysis_info = {'permas_type': analysis_type}
                 analysis_info['STATENAME_string'] = availableanalyses_all[analysis_type]
@@ -226,4 +425,10 @@ def PermasHdfRead(openfile, keyword, variable_keyword='NONE'):
                     analysis_info['temporal_type'] = 'timesteps'
                 analysis_info['temporal_values'] = list(col_des)
 
+    # nothing read: empty, but with the auxiliary columns and their types
+    if HdfData is None:
+        HdfData = pd.DataFrame({'node': np.empty(0, dtype=np.int64),
+                                'temporal': np.empty(0, dtype=np.float64),
+                                'variabletype': np.empty(0, dtype=object)})
+
     return analysis_info, HdfData
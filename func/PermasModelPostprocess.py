@@ -16,8 +16,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import itertools
 import numpy as np
 import sys
+from . import auxiliary as aux
 
 
 def PermasModelPostprocess(
@@ -39,13 +41,15 @@ def PermasModelPostprocess(
     Returns
     -------
     nodes : array of float64
-    esets : list of lists of strings
+    esets : list of arrays of int64
         Only contains the esets of certain element types. Same order as
         partnames.
     partnames : list of strings
         Partnames corresponding to cleaned-up version of esets.
     elements_hexe8 : array of int32
+        Sorted by element index.
     elements_tet10 : array of int32
+        Sorted by element index.
     nodes_all_ids : array of int32
         Sorted indices of all nodes.
     esets_types : list of strings
@@ -54,41 +58,42 @@ def PermasModelPostprocess(
         Sorted indices of all HEXE8.
     elements_tet10_ids : array of int32
         Sorted indices of all TET10.
-    nsets_first : list of strings
+    nsets_first : array of int64
         First element of every nset.
-    surfs_firstel : list of strings
+    surfs_firstel : array of int64
         First element of every surf definition.
 
     """
     print('POSTPROCESSING READ DATA')
 
-    # convert nodes end elements to most appropriate numpy arrays
-    nodes = np.array(nodes, dtype=np.float64)
-    elements_hexe8 = np.array(elements_hexe8, dtype=np.int32)
-    elements_tet10 = np.array(elements_tet10, dtype=np.int32)
-
-    # rearrange tet10 from PERMAS to VMAP definition
-    tet10_vmap = [0] * 10
-    for tet10_permas in elements_tet10:
-        tet10_vmap[0] = tet10_permas[1]
-        tet10_vmap[4] = tet10_permas[2]
-        tet10_vmap[1] = tet10_permas[3]
-        tet10_vmap[5] = tet10_permas[4]
-        tet10_vmap[2] = tet10_permas[5]
-        tet10_vmap[6] = tet10_permas[6]
-        tet10_vmap[7] = tet10_permas[7]
-        tet10_vmap[8] = tet10_permas[8]
-        tet10_vmap[9] = tet10_permas[9]
-        tet10_vmap[3] = tet10_permas[10]
-
-        tet10_permas[1:] = tet10_vmap
+    # nodes and elements are read as numpy arrays already, no copy if so
+    nodes = np.asarray(nodes, dtype=np.float64)
+    elements_hexe8 = np.asarray(elements_hexe8, dtype=np.int32)
+    elements_tet10 = np.asarray(elements_tet10, dtype=np.int32)
+
+    # rearrange tet10 from PERMAS to VMAP definition: the i-th VMAP node is
+    # the PERMAS node in column tet10_permas2vmap[i], for all elements at once
+    tet10_permas2vmap = np.array([1, 3, 5, 10, 2, 4, 6, 7, 8, 9])
+    if elements_tet10.ndim == 2:
+        elements_tet10[:, 1:] = elements_tet10[:, tet10_permas2vmap]
+
+    # sort nodes and elements by ID, s.t. they can be looked up by bisection.
+    # the nodes are usually sorted in the model already
+    if nodes.ndim == 2 and (np.diff(nodes[:, 0]) < 0).any():
+        nodes = nodes[np.argsort(nodes[:, 0], kind='stable')]
+    if elements_hexe8.ndim == 2:
+        elements_hexe8 = elements_hexe8[
+            np.argsort(elements_hexe8[:, 0], kind='stable')]
+    if elements_tet10.ndim == 2:
+        elements_tet10 = elements_tet10[
+            np.argsort(elements_tet10[:, 0], kind='stable')]
 
     # get IDs in dedicated array for efficient access (np.array's default is c-contiguous)
     nodes_all_ids = np.array(nodes[:, 0], dtype=np.int32)
-    elements_hexe8_ids = elements_hexe8[:, 0] if elements_hexe8.ndim == 2 \
-        else []
-    elements_tet10_ids = elements_tet10[:, 0] if elements_tet10.ndim == 2 \
-        else []
+    elements_hexe8_ids = np.array(elements_hexe8[:, 0], dtype=np.int32) \
+        if elements_hexe8.ndim == 2 else np.empty(0, dtype=np.int32)
+    elements_tet10_ids = np.array(elements_tet10[:, 0], dtype=np.int32) \
+        if elements_tet10.ndim == 2 else np.empty(0, dtype=np.int32)
 
     # clean partnames_temp: esets_temp are parts iff they consist of HEXE8 or TET10
     # assumption: esets_temp consist of homogeneous element type, i.e. it suffices to check only the first element's type
@@ -96,46 +101,46 @@ def PermasModelPostprocess(
     esets_temp = []
     esets_types = []
     partnames_temp = []
-    for ct_eset, eset in enumerate(esets):
-        if int(eset[0]) in elements_hexe8_ids:
+    # element types of the first elements of all esets, in one pass each
+    esets_first = np.array([int(eset[0]) for eset in esets], dtype=np.int64)
+    esets_first_types = np.where(
+        aux.contains(elements_hexe8_ids, esets_first), 'HEXE8',
+        np.where(aux.contains(elements_tet10_ids, esets_first), 'TET10', ''))
+    for eset, partname, eset_type in zip(esets, partnames,
+                                         esets_first_types.tolist()):
+        if eset_type != '':
             esets_temp.append(eset)
-            partnames_temp.append(partnames[ct_eset])
-            esets_types.append('HEXE8')
-            print('  part ' + partnames_temp[-1] +
-                  ' has element type ' + esets_types[-1])
-        elif int(eset[0]) in elements_tet10_ids:
-            esets_temp.append(eset)
-            partnames_temp.append(partnames[ct_eset])
-            esets_types.append('TET10')
-            print('  part ' + partnames_temp[-1] +
-                  ' has element type ' + esets_types[-1])
+            partnames_temp.append(partname)
+            esets_types.append(eset_type)
+            print('  part ' + partname + ' has element type ' + eset_type)
         else:
-            print('  eset ' + partnames[ct_eset] +
-                  ' is removed from list of parts')
+            print('  eset ' + partname + ' is removed from list of parts')
     esets = esets_temp
     partnames = partnames_temp
     print('... done')
 
-    # define nsets_first: list of first elements of nsets
-    nsets_first = [None] * len(nsets)
-    for nset_id, nset in enumerate(nsets):
-        nsets_first[nset_id] = nset[0]
+    # define nsets_first: first elements of nsets, numeric for np.isin
+    nsets_first = np.fromiter((nset[0] for nset in nsets),
+                              dtype=np.int64, count=len(nsets))
 
-    # define surfs_firstel: list of first elements of surfs
-    surfs_firstel = [None] * len(surfs)
-    for surf_id, surf in enumerate(surfs):
-        surfs_firstel[surf_id] = surf[0][0]
+    # define surfs_firstel: first elements of surfs, numeric for np.isin
+    surfs_firstel = np.fromiter((int(surf[0][0]) for surf in surfs),
+                                dtype=np.int64, count=len(surfs))
 
     # check if surfaces belong to parts. throw error if they don't
     # assumption: surfaces are defined within one eset only, i.e. it suffices to check only the surface's first element
     print('assuring that all surfaces belong to parts ... ', end='')
+    esets_elements = set(itertools.chain.from_iterable(esets))
     for surf_id, surf in enumerate(surfs):
-        if not (surf[0][0] in eset for eset in esets):
+        if surf[0][0] not in esets_elements:
             print('\nERROR: surface with ID ' +
                   surfs_ids[surf_id] + ' does not belong to any part. this case is not yet implemented.')
             sys.exit(1)
     print('done')
 
+    # element IDs of esets as numeric arrays, converted once for all lookups
+    esets = [np.array(eset, dtype=np.int64) for eset in esets]
+
     print()
 
     return nodes, \
@@ -26,8 +26,102 @@ from . import PermasHdfRead
 
 
 def print_readline(line_split):
-    """Print the current line that has been split."""
-    print('extracting ' + ' '.join(line_split), end='', flush=True)
+    """Print the current line that has been split into bytes."""
+    print('extracting ' + b' '.join(line_split).decode('UTF-8'), end='',
+          flush=True)
+
+
+def split_block(model_lines, start, end):
+    """
+    Split the data lines of a block into their items.
+
+    Parameters
+    ----------
+    model_lines : np.array of bytes
+        Lines of the model, without leading blanks.
+    start : int
+        Index of the first data line of the block.
+    end : int
+        Index after the last data line of the block.
+
+    Returns
+    -------
+    rows : list of lists of strings
+        One list per data line. Continued lines (&) are appended to the line
+        they continue.
+
+    """
+    rows = []
+    for line in model_lines[start:end].tolist():
+        line_split = line.decode('UTF-8').split()
+        if line_split[0] == '&':
+            rows[-1] += line_split[1:]
+        else:
+            rows.append(line_split)
+    return rows
+
+
+def split_block_items(model_lines, start, end):
+    """
+    Split the data lines of a block into one list of all their items.
+
+    Parameters
+    ----------
+    model_lines : np.array of bytes
+        Lines of the model, without leading blanks.
+    start : int
+        Index of the first data line of the block.
+    end : int
+        Index after the last data line of the block.
+
+    Returns
+    -------
+    items : list of strings
+        Items of all data lines in order, without continuation marks (&).
+
+    """
+    # continued lines are joined to the line they continue
+    block = b'\n'.join(model_lines[start:end].tolist()).replace(b'\n&', b' ')
+    items = block.decode('UTF-8').split()
+    return items
+
+
+def parse_block(model_lines, start, end, dtype):
+    """
+    Parse the data lines of a block into a numeric matrix.
+
+    Parameters
+    ----------
+    model_lines : np.array of bytes
+        Lines of the model, without leading blanks.
+    start : int
+        Index of the first data line of the block.
+    end : int
+        Index after the last data line of the block.
+    dtype : numpy dtype
+        Type of the values.
+
+    Returns
+    -------
+    values : np.array of dtype
+        num-lines x num-items. Continued lines (&) are appended to the line
+        they continue. Empty if the block is empty.
+
+    """
+    if start == end:
+        return np.empty((0, 0), dtype=dtype)
+    # continued lines are joined to the line they continue
+    block = b'\n'.join(model_lines[start:end].tolist()).replace(b'\n&', b' ')
+    values = np.array(block.split(), dtype=dtype)
+    return values.reshape(block.count(b'\n') + 1, -1)
+
+
+def concatenate_blocks(blocks, dtype):
+    """Concatenate the matrices of several blocks, empty if there is none."""
+    blocks = [block for block in blocks if block.size > 0]
+    if len(blocks) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(blocks)
 
 
 def flatten_sets(list_3level):
@@ -45,9 +139,8 @@ def flatten_sets(list_3level):
         preserved.
 
     """
-    list_2level = [None] * len(list_3level)
-    for ct_set, mylist in enumerate(list_3level):
-        list_2level[ct_set] = list(itertools.chain(*mylist))
+    list_2level = [list(itertools.chain.from_iterable(mylist))
+                   for mylist in list_3level]
     return list_2level
 
 
@@ -69,10 +162,10 @@ def PermasModelRead(inputfile_model):
         Names of parts, same order as eset.
     elements_hexe8 : np.array of int32
         num-elems-hexe8 x 9, first col is element index, remaining cols are
-        defining nodes
+        defining nodes. 1D and empty if there is no HEXE8.
     elements_tet10 : np.array of int32
         num-elems-tet10 x 11, first col is element index, remaining cols are
-        defining nodes
+        defining nodes. 1D and empty if there is no TET10.
     sfsets_names : list of strings
         Names of sfsets, same order as sfsets_ids.
     sfsets_ids : list of lists of strings
@@ -87,9 +180,9 @@ def PermasModelRead(inputfile_model):
     surfs_flat : list of lists of strings
         Flattened version of surfs: the deepest two levels are merged. Element
         index and corresponding face index are alternating.
-    nsets : list of lists of strings
-        List containing one list of nodal indices for each nset. Same order as
-        nset_names.
+    nsets : list of np.arrays of int64
+        List containing one array of nodal indices for each nset. Same order
+        as nset_names.
     nsets_names : list of strings
         Contains the names of the nsets. Same order as nsets.
     materials : list of dictionaries
@@ -99,7 +192,7 @@ def PermasModelRead(inputfile_model):
         Relates partnames to materials.
     coorsystems : list of lists of floats
         One list per cylindrical coordinate system. Contains all numerical
-        values of the definition in chronological order.
+        values of the definition in chronological order, at least 10.
 
     """
     print('READING DATA')
@@ -107,13 +200,29 @@ def PermasModelRead(inputfile_model):
 
     _, model_h5dataset = PermasHdfRead.PermasHdfRead(inputfile_model, 'model')
 
-    # change datatype from h5py._hl.dataset.Dataset to numpy.ndarray to list
-    # https://www.w3resource.com/numpy/string-operations/decode.php
-    model_list = list(np.char.decode(model_h5dataset, encoding='UTF-8'))
+    # read the lines as bytes, in pieces of whole HDF5 chunks of about 1 MB,
+    # s.t. the temporaries of the string operations stay small. the lines
+    # are only decoded where they are parsed.
+    num_lines = model_h5dataset.shape[0]
+    piece_rows = max(1, 2**20 // model_h5dataset.dtype.itemsize)
+    if model_h5dataset.chunks is not None:
+        piece_rows = -(-piece_rows // model_h5dataset.chunks[0]) * \
+            model_h5dataset.chunks[0]
+    model_lines = np.empty(num_lines, dtype=model_h5dataset.dtype)
+    for start in range(0, num_lines, piece_rows):
+        model_lines[start:start+piece_rows] = np.char.lstrip(
+            model_h5dataset[start:start+piece_rows])
 
     del(model_h5dataset)
 
-    # result containers
+    # data lines start with an index or with & (continued line). every other
+    # line is a header. the first bytes of all lines are a strided view of
+    # the lines, so they are classified at once without any copy
+    first_bytes = model_lines.view(np.uint8)[::model_lines.itemsize]
+    line_is_data = ((first_bytes >= ord('0')) & (first_bytes <= ord('9'))) | \
+        (first_bytes == ord('&'))
+
+    # result containers. nodes and elements collect one matrix per block
     nodes = []
     elements_hexe8 = []
     elements_tet10 = []
@@ -141,80 +250,76 @@ def PermasModelRead(inputfile_model):
     # but NOT more complicated data structure such as materials and coor sys.
     # however, we will remember the positions at which the latter are located
 
-    current_data = None  # this will point to the above containers or to their future contents
-    current_data_name = None
-
-    # main loop. paradigm: process each line exactly once
-    for ct_line, line in enumerate(model_list):
-        line_split = line.lstrip().split()
-        line_is_data = line_split[0].isdecimal() or line_split[0] == '&'
-        if current_data != None:  # this is needed because there might be data blocks that are ignored
-            if line_split[0].isdecimal():  # we have a data line
-                current_data.append(line_split)
-            elif line_split[0] == '&':  # we have a continued data line
-                current_data[-1] += line_split[1:]
-            else:  # i.e. line_is_data == False
-                if not current_data_name == None:
-                    print(' ... done')
-                    current_data_name = None
-        if not line_is_data:
-            # set current_data to whichever container is appropriate
-            if line_split[0] == '$COOR':
-                current_data = nodes
-                current_data_name = '$COOR'
-                print_readline(line_split)
-            elif line_split[0] == '$ELEMENT':
-                if line_split[-1] == 'HEXE8':
-                    current_data = elements_hexe8
-                    current_data_name = '$ELEMENT HEXE8'
-                    print_readline(line_split)
-                elif line_split[-1] == 'TET10':
-                    current_data = elements_tet10
-                    current_data_name = '$ELEMENT TET10'
-                    print_readline(line_split)
-                else:
-                    print('skipping ' + ' '.join(line_split), flush=True)
-                    current_data = None
-                    current_data_name = ''
-            elif line_split[0] == '$ESET':
-                esets.append([])
-                current_data = esets[-1]
-                current_data_name = line_split[-1]
-                partnames.append(line_split[-1])
-                print_readline(line_split)
-            elif line_split[0] == '$NSET':
-                nsets.append([])
-                current_data = nsets[-1]
-                current_data_name = line_split[-1]
-                nsets_names.append(line_split[-1])
-                print_readline(line_split)
-            elif line_split[0] == '$SURFACE':
-                surfs.append([])
-                current_data = surfs[-1]
-                current_data_name = line_split[-1]
-                surfs_ids.append(line_split[4])
+    # the block of a header consists of the data lines up to the next header
+    header_position = np.flatnonzero(~line_is_data)
+    block_end = np.append(header_position[1:], len(model_lines))
+
+    # main loop. paradigm: process each header exactly once, and each block
+    # as a whole
+    for ct_line, end in zip(header_position.tolist(), block_end.tolist()):
+        # the header is split as bytes, only names are decoded
+        line_split = model_lines[ct_line].split()
+        if len(line_split) == 0:
+            continue
+        # coordinates and elements are parsed into numbers at once
+        if line_split[0] == b'$COOR':
+            print_readline(line_split)
+            nodes.append(parse_block(
+                model_lines, ct_line + 1, end, np.float64))
+            print(' ... done')
+        elif line_split[0] == b'$ELEMENT':
+            if line_split[-1] == b'HEXE8':
                 print_readline(line_split)
-            elif line_split[0] == '$SFSET':
-                sfsets_ids.append([])
-                current_data = sfsets_ids[-1]
-                current_data_name = line_split[-1]
-                sfsets_names.append(line_split[-1])
+                elements_hexe8.append(parse_block(
+                    model_lines, ct_line + 1, end, np.int32))
+                print(' ... done')
+            elif line_split[-1] == b'TET10':
                 print_readline(line_split)
-            elif line_split[0] == '$MATERIAL':
-                material_position.append(ct_line)
-            elif line_split[0] == '$RSYS':
-                coorsys_position.append(ct_line)
-            elif line_split[0] == '$ELPROP':
-                elprop_position.append(ct_line)
+                elements_tet10.append(parse_block(
+                    model_lines, ct_line + 1, end, np.int32))
+                print(' ... done')
             else:
-                current_data = None
+                print('skipping ' + b' '.join(line_split).decode('UTF-8'),
+                      flush=True)
+        # sets are read as flat lists of their items at once
+        elif line_split[0] == b'$ESET':
+            partnames.append(line_split[-1].decode('UTF-8'))
+            print_readline(line_split)
+            esets.append(split_block_items(model_lines, ct_line + 1, end))
+            print(' ... done')
+        elif line_split[0] == b'$NSET':
+            nsets_names.append(line_split[-1].decode('UTF-8'))
+            print_readline(line_split)
+            # node indices are converted once, they are passed on as numbers
+            nsets.append(np.array(
+                split_block_items(model_lines, ct_line + 1, end),
+                dtype=np.int64))
+            print(' ... done')
+        elif line_split[0] == b'$SURFACE':
+            surfs_ids.append(line_split[4].decode('UTF-8'))
+            print_readline(line_split)
+            surfs.append(split_block(model_lines, ct_line + 1, end))
+            print(' ... done')
+        elif line_split[0] == b'$SFSET':
+            sfsets_names.append(line_split[-1].decode('UTF-8'))
+            print_readline(line_split)
+            sfsets_ids.append(split_block_items(model_lines, ct_line + 1, end))
+            print(' ... done')
+        elif line_split[0] == b'$MATERIAL':
+            material_position.append(ct_line)
+        elif line_split[0] == b'$RSYS':
+            coorsys_position.append((ct_line, end))
+        elif line_split[0] == b'$ELPROP':
+            elprop_position.append(ct_line)
     print()
 
+    # %%% concatenate numeric blocks
+    nodes = concatenate_blocks(nodes, np.float64)
+    elements_hexe8 = concatenate_blocks(elements_hexe8, np.int32)
+    elements_tet10 = concatenate_blocks(elements_tet10, np.int32)
+
     # %%% flatten 3-level lists
-    # 3-level lists are flattened s.t. each of them is a list of lists (wich no further lower level lists)
-    esets = flatten_sets(esets)
-    nsets = flatten_sets(nsets)
-    sfsets_ids = flatten_sets(sfsets_ids)
+    # surfs are flattened s.t. surfs_flat is a list of lists (wich no further lower level lists)
     surfs_flat = flatten_sets(surfs)
 
     # %% read 2
@@ -223,10 +328,10 @@ def PermasModelRead(inputfile_model):
     # %%% MATERIAL
     for ct_mat, mat_pos in enumerate(material_position):
         # header
-        line_split = model_list[mat_pos].lstrip().split()
+        line_split = model_lines[mat_pos].decode('UTF-8').split()
         if not 'NAME' in line_split:
             print('WARNING: material has no name. skipping line: ' +
-                  model_list[mat_pos])
+                  model_lines[mat_pos].decode('UTF-8'))
             continue
         if not 'ISO' in line_split:
             print('WARNING: material is not ISO, which has not been tested')
@@ -234,69 +339,65 @@ def PermasModelRead(inputfile_model):
         print('extracting material ' +
               materials[-1]['name'] + ' ... ', end='')
 
-        # body
-        pos_offset = 1
-        line_split = model_list[mat_pos+pos_offset].lstrip().split()
-        while not line_split[0] == '$END':
-            line = model_list[mat_pos+pos_offset].lstrip()
-            if line == '$ELASTIC  GENERAL  INPUT = DATA':
-                pos_offset += 1
-                materials[-1]['modulus'] = float(
-                    model_list[mat_pos + pos_offset].lstrip().split()[0])
-                materials[-1]['poisson'] = float(
-                    model_list[mat_pos + pos_offset].lstrip().split()[1])
-            elif line.startswith('$ELASTIC'):
+        # body. the lines are compared and converted as bytes, each line is
+        # split once
+        ct_line = mat_pos + 1
+        line = model_lines[ct_line]
+        while line.split(None, 1)[:1] != [b'$END']:
+            if line == b'$ELASTIC  GENERAL  INPUT = DATA':
+                ct_line += 1
+                line_split = model_lines[ct_line].split()
+                materials[-1]['modulus'] = float(line_split[0])
+                materials[-1]['poisson'] = float(line_split[1])
+            elif line.startswith(b'$ELASTIC'):
                 print('WARNING: unknown $ELASTIC block, continuing')
-            elif line == '$DENSITY  GENERAL  INPUT = DATA':
-                pos_offset += 1
+            elif line == b'$DENSITY  GENERAL  INPUT = DATA':
+                ct_line += 1
                 materials[-1]['density'] = float(
-                    model_list[mat_pos + pos_offset].lstrip().split()[0])
-            elif line.startswith('$DENSITY'):
+                    model_lines[ct_line].split(None, 1)[0])
+            elif line.startswith(b'$DENSITY'):
                 print('WARNING: unknown $DENSITY block, continuing')
-            pos_offset += 1
-            line_split = model_list[mat_pos+pos_offset].lstrip().split()
+            ct_line += 1
+            line = model_lines[ct_line]
         print('... done')
     print()
 
     # %%% ELPROP
     for elprop_pos in elprop_position:
         print('extracting ELPROP block ... ')
-        pos_offset = 1
-        line_split = model_list[elprop_pos+pos_offset].lstrip().split()
-        while not (line_split[0].startswith('$') or line_split[0].startswith('!')):
+        ct_line = elprop_pos + 1
+        line_split = model_lines[ct_line].decode('UTF-8').split()
+        while not line_split[0].startswith(('$', '!')):
             if line_split[1] == 'MATERIAL':
                 # add pair PART:MATERIAL to dictionary eset_material
                 eset_material[line_split[0]] = line_split[-1]
                 print('  ' + line_split[0] + ': ' + line_split[-1])
-            pos_offset += 1
-            line_split = model_list[elprop_pos+pos_offset].lstrip().split()
+            ct_line += 1
+            line_split = model_lines[ct_line].decode('UTF-8').split()
         print('... done')
     if len(eset_material) == 0:
         print('NOTE: no $ELPROP or no material assignment found. This may be due to use of $INSERT VARIANT, no checks performed.')
     print()
 
     # %%% RSYS
-    for coorsys_pos in coorsys_position:
+    for coorsys_pos, coorsys_end in coorsys_position:
         print('extracting RSYS block ... ')
-        pos_offset = 1
-        line_split = model_list[coorsys_pos+pos_offset].lstrip().split()
-        while not (line_split[0].startswith('$') or line_split[0].startswith('!')):
-            if line_split[0].isdecimal():  # begin of coordinate system def
-                coorsystems.append([])
-                # exclude ending colon. assumption: entry is number if it begins with a digit or a minus sign
-                coorsystems[-1] += [float(number) for number in line_split if (
-                    number[0].isdecimal() or number[0] == '-')]
-                pos_offset += 1
-                line_split = model_list[coorsys_pos+pos_offset].lstrip().split()
-            elif line_split[0] == '&':
-                del line_split[0]
-                coorsystems[-1] += [float(number) for number in line_split if (
-                    number[0].isdecimal() or number[0] == '-')]
-                pos_offset += 1
-                line_split = model_list[coorsys_pos+pos_offset].lstrip().split()
-            else:
-                print('ERROR: this should not be reached')
+        # one line per coordinate system, continued lines (&) are joined
+        block = b'\n'.join(model_lines[coorsys_pos+1:coorsys_end].tolist())
+        if len(block) == 0:
+            continue
+        for line in block.replace(b'\n&', b' ').split(b'\n'):
+            # exclude ending colon. assumption: entry is number if it begins with a digit or a minus sign
+            numbers = [number.rstrip(b':') for number in line.split()
+                       if number[:1].isdigit() or number[:1] == b'-']
+            # identifier, reference point and two axis vectors are required
+            if len(numbers) < 10:
+                print('ERROR: RSYS definition has ' + str(len(numbers)) +
+                      ' values, but at least 10 are required: ' +
+                      line.decode('UTF-8'))
                 sys.exit(1)
+            # all numbers of the coordinate system are converted at once
+            coorsystems.append(np.array(numbers, dtype=np.float64).tolist())
 
     # %% return
     print()
@@ -0,0 +1,98 @@
+"""
+Functions for postprocessing of Permas results.
+
+Copyright 2022 German Aerospace Center (DLR e.V.)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+def assign_parts(node_ids, esets_nodes_unique):
+    """
+    Determine the part of each node.
+
+    The node indices of all parts are concatenated into one array, alongside
+    a parallel array of part indices. Both are sorted once by node index, then
+    the parts of all nodes are found by a single np.searchsorted. This does
+    not require the node indices to be dense.
+
+    Parameters
+    ----------
+    node_ids : np.array of int
+        Node indices, e.g. of nodal results.
+    esets_nodes_unique : see VmapWriteGeometry
+
+    Returns
+    -------
+    part_ids : np.array of int32
+        Index of the part of each entry of node_ids, same order as the parts
+        in esets_nodes_unique. A node belonging to several parts is assigned
+        to the first of them. -1 denotes nodes without part.
+
+    """
+    parts_node_ids = np.concatenate(esets_nodes_unique)
+    parts_part_ids = np.repeat(
+        np.arange(len(esets_nodes_unique), dtype=np.int32),
+        [eset_nodes_unique.shape[0]
+         for eset_nodes_unique in esets_nodes_unique])
+
+    # stable sort: for shared nodes, the first part comes first
+    order = np.argsort(parts_node_ids, kind='stable')
+    parts_node_ids = parts_node_ids[order]
+    parts_part_ids = parts_part_ids[order]
+
+    # leftmost match, i.e. first part containing the node
+    positions = np.searchsorted(parts_node_ids, node_ids)
+    np.minimum(positions, parts_node_ids.shape[0] - 1, out=positions)
+    part_ids = parts_part_ids[positions]
+    part_ids[parts_node_ids[positions] != node_ids] = -1
+    return part_ids
+
+
+def group_rows(results_pd, keys):
+    """
+    Sort rows by categorical key columns, s.t. each group is contiguous.
+
+    Parameters
+    ----------
+    results_pd : Pandas dataframe
+        Contains the categorical columns named in keys.
+    keys : list of strings
+        Names of the key columns, the first one is the primary sort key.
+
+    Returns
+    -------
+    order : np.array of int
+        Row positions of results_pd in sorted order.
+    groups : dictionary
+        Maps each occurring tuple of key values to the slice of its rows
+        within the sorted order.
+
+    """
+    codes = [results_pd[key].cat.codes.to_numpy() for key in keys]
+    categories = [results_pd[key].cat.categories for key in keys]
+    # np.lexsort sorts by the last key first
+    order = np.lexsort(codes[::-1])
+    codes_sorted = np.column_stack(codes)[order]
+    starts = np.flatnonzero(np.concatenate((
+        [True], (codes_sorted[1:] != codes_sorted[:-1]).any(axis=1))))
+    ends = np.append(starts[1:], order.shape[0])
+
+    groups = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        group_key = tuple(key_categories[code] for key_categories, code
+                          in zip(categories, codes_sorted[start]))
+        groups[group_key] = slice(start, end)
+    return order, groups
@@ -16,6 +16,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import numpy as np
 import pandas as pd
 from . import PermasHdfRead
 
@@ -56,28 +57,45 @@ def PermasResultsRead(inputfile_results, timesteps_user, variables_node_user):
         node_results_pd = pd.DataFrame([])
     else:
         if not 'DEFAULT' in variables_node_user:
-            for ct_var, var_keyword in enumerate(variables_node_user):
+            node_results_vars = []
+            # analysis of each situation, read once for all variables of
+            # this file
+            analysis_cache = {}
+            for var_keyword in variables_node_user:
                 analysis_type_temp, node_results_var = PermasHdfRead.PermasHdfRead(
-                    inputfile_results, 'node_results', variable_keyword=var_keyword)
+                    inputfile_results, 'node_results',
+                    variable_keyword=var_keyword,
+                    analysis_cache=analysis_cache)
                 # analysis=='' if requested variable is not present
                 if analysis_info == {}:
                     analysis_info = analysis_type_temp
-                if ct_var == 0:
-                    node_results_pd = node_results_var
-                else:
-                    node_results_pd = pd.concat(
-                        (node_results_pd, node_results_var), axis=0)
-            # only needed timesteps:
-            if not 'DEFAULT' in timesteps_user:
-                node_results_pd = node_results_pd[node_results_pd.temporal.isin(
-                    timesteps_user)]
+                # only needed timesteps, selected before concatenating by a
+                # mask computed on the numpy column
+                if not 'DEFAULT' in timesteps_user:
+                    node_results_var = node_results_var[np.isin(
+                        node_results_var['temporal'].to_numpy(),
+                        timesteps_user)]
+                # empty if not present, nothing to concatenate then
+                if not node_results_var.empty:
+                    node_results_vars.append(node_results_var)
+            # concatenate once, s.t. each variable's results are copied once.
+            # a single variable is used as is, without any copy. if none is
+            # present, the last (empty) one is used
+            if len(node_results_vars) == 0:
+                node_results_pd = node_results_var
+            elif len(node_results_vars) == 1:
+                node_results_pd = node_results_vars[0]
+            else:
+                node_results_pd = pd.concat(node_results_vars, axis=0,
+                                            ignore_index=True, copy=False)
         else:
             node_results_pd = []
 
     # determine the different timesteps and variabletypes for the results
     try:
+        # the few distinct names are found by hashing, only they are sorted
         variablestypes_nodes_list = sorted(
-            list(set(node_results_pd.variabletype)))
+            pd.unique(node_results_pd.variabletype))
     except AttributeError:
         variablestypes_nodes_list = []
 
@@ -22,6 +22,51 @@ import PyVMAP as VMAP
 from func import VmapReadfunctions as readfunc
 
 
+def concat_frames(frames):
+    """
+    Concatenate DataFrames once, keeping their indices like DataFrame.append.
+
+    Parameters
+    ----------
+    frames : list of Pandas DataFrames
+
+    Returns
+    -------
+    frame : Pandas DataFrame
+        Empty if frames is empty.
+
+    """
+    if len(frames) == 0:
+        return pd.DataFrame([])
+    return pd.concat(frames, axis=0, copy=False)
+
+
+def drop_duplicate_ids(frame, subset, ignore_index=False):
+    """
+    Drop the rows whose identifying columns duplicate those of earlier rows.
+
+    Only the columns in subset are hashed, not the coordinates, connectivity
+    or result values, which are identical for duplicate IDs.
+
+    Parameters
+    ----------
+    frame : Pandas DataFrame
+    subset : list of column labels
+        Identifying columns.
+    ignore_index : bool, optional
+        Renumber the rows. The default is False.
+
+    Returns
+    -------
+    frame : Pandas DataFrame
+        Returned as is if empty.
+
+    """
+    if frame.empty:
+        return frame
+    return frame.drop_duplicates(subset=subset, ignore_index=ignore_index)
+
+
 def VmapRead(FILENAME, keyword="both"):
     """
     Read model and/or result data from VMAP and return Pandas DataFrames.
@@ -77,13 +122,14 @@ def VmapRead(FILENAME, keyword="both"):
     variables = "/VMAP/VARIABLES/"
     states = file.getSubGroups(variables)
 
-    # define empty Datasets
-    points = pd.DataFrame([])
-    nsets = pd.DataFrame([])
-    surface = pd.DataFrame([])
-    elements = pd.DataFrame([])
-    variable = pd.DataFrame([])
-    elems_res = pd.DataFrame([])
+    # define empty lists of the pieces of the Datasets, each Dataset is
+    # concatenated once from its pieces
+    points_chunks = []
+    nsets_chunks = []
+    surface_chunks = []
+    elements_chunks = []
+    variable_chunks = []
+    elems_res_chunks = []
 
     # %% POINTS
     # GEOMETRY NODES - required for every keyword
@@ -93,9 +139,11 @@ def VmapRead(FILENAME, keyword="both"):
             file, grp=geometry+'%s' % (parts[i][0]))
         # add column "part"
         points_part.insert(1, 'part', parts[i][1])
-        # append to complete dataframe
-        points = points.append(points_part)
-    points = points.drop_duplicates()
+        # append to list of pieces
+        points_chunks.append(points_part)
+    points = drop_duplicate_ids(concat_frames(points_chunks),
+                                ['nodes', 'part'])
+    del points_chunks
 
     # %% GEOMETRYSETS
     # NSET and SURFACE - only required for model
@@ -107,24 +155,29 @@ def VmapRead(FILENAME, keyword="both"):
             for myset in geometrysetVector:
                 if myset.getSetType() == 0:  # nodal set
                     if myset.getSetIndexType() == 1:  # single value per node
-                        myset_pd = pd.DataFrame(myset.getGeometrySetData())
+                        # copied into an array at once, like the surfaces
+                        myset_pd = pd.DataFrame(np.asarray(
+                            myset.getGeometrySetData()))
                         myset_pd['NAME'] = myset.getSetName()
-                        nsets = nsets.append(myset_pd)
+                        nsets_chunks.append(myset_pd)
                     else:
                         print(
                             "ERROR: nodal set with multiple values is not implemented")
                 elif myset.getSetType() == 1:  # elemental set
                     if myset.getSetIndexType() == 2:  # pair of values per element
-                        myset_pd_temp = pd.DataFrame(myset.getGeometrySetData())
-                        myset_pd = pd.DataFrame(np.concatenate(
-                            (np.array(myset_pd_temp[::2]), np.array(myset_pd_temp[1::2])), axis=1))
+                        # alternating element and face, one row per pair
+                        myset_pd = pd.DataFrame(np.asarray(
+                            myset.getGeometrySetData()).reshape(-1, 2))
                         myset_pd['NAME'] = myset.getSetName()
-                        surface = surface.append(myset_pd)
+                        surface_chunks.append(myset_pd)
                     else:
                         print(
                             "ERROR: elemental set with single value is not implemented")
                 else:
                     print("ERROR: you have violated the VMAP standard")
+    nsets = concat_frames(nsets_chunks)
+    surface = concat_frames(surface_chunks)
+    del nsets_chunks, surface_chunks
 
     # %% ELEMENTS
     # get a dict of elementtypes and size of elements (HEXE8 = 8, TET10 = 10))
@@ -136,41 +189,63 @@ def VmapRead(FILENAME, keyword="both"):
             file, elementtypes, grp=geometry+'%s' % (parts[i][0]))
         elements_parts.insert(1, 'part', parts[i][1])
 
-        elements = elements.append(elements_parts)
+        elements_chunks.append(elements_parts)
         # safe the length of individual elements for esets
         length_esets.append(len(elements_parts))
+    elements = concat_frames(elements_chunks)
+    del elements_chunks
     elements.rename(columns={0: 'element', 1: 'elementtype'}, inplace=True)
     esets = elements.set_index(np.arange(elements.shape[0]))
-    elements = elements.sort_values(by=['element'])
-    elements = elements.drop_duplicates()
-    esets = esets.drop_duplicates()
+    # sort by element ID, directly on the numpy column
+    elements = elements.take(
+        np.argsort(elements['element'].to_numpy(), kind='stable'))
+    elements = drop_duplicate_ids(elements, ['element', 'part'])
+    esets = drop_duplicate_ids(esets, ['element', 'part'])
 
     # %% VARIABLES
     if keyword != "model" and len(states) != 0:
+        # nodes and elements of each part, split once for all states. a part
+        # without any is given the empty selection
+        points_parts = {name: group.nodes for name, group
+                        in points.groupby('part', sort=False)}
+        elements_parts_all = {name: group.element for name, group
+                              in elements.groupby('part', sort=False)}
         # read out every State-n
         for n in range(len(states)):
             state_times = file.getVariableStateInformation(n)
             for i in range(len(parts)):
                 variablestypes = file.getSubGroups(
                     variables+states[n]+"/%s" % (parts[i][0]))
-                # das hier jedes mal auszurechnen braucht ziemlich viel zeit
-                points_part = points[points.part == parts[i][1]].nodes
-                elements_parts = elements[elements.part == parts[i][1]].element
+                points_part = points_parts.get(
+                    parts[i][1], points.nodes.iloc[:0])
+                elements_parts = elements_parts_all.get(
+                    parts[i][1], elements.element.iloc[:0])
                 for j in range(len(variablestypes)):
                     #-------- VARIABLE ELEMENTS -------------------------------------------------#
                     if "ELEMENT" in variablestypes[j]:
                         elems_res_part = readfunc.read_variables_points(
                             file, elements_parts, grp=variables+states[n]+'/%s/' % (parts[i][0]), state=state_times[1], variablestype=variablestypes[j])
-                        elems_res = elems_res.append(elems_res_part)
+                        elems_res_chunks.append(elems_res_part)
                     else:
                         #-------- VARIABLE NODES ----------------------------------------------------#
                         variable_part = readfunc.read_variables_points(
                             file, points_part, grp=variables+states[n]+'/%s/' % parts[i][0], state=state_times[1], variablestype=variablestypes[j])
-                        variable = variable.append(variable_part)
+                        variable_chunks.append(variable_part)
 
-        # drop duplicate rows
-        elems_res = elems_res.drop_duplicates()
-        variable = variable.drop_duplicates()
+    # drop duplicate rows
+    elems_res = drop_duplicate_ids(concat_frames(elems_res_chunks),
+                                   ['index', 'State', 'Variabletype'],
+                                   ignore_index=True)
+    variable = drop_duplicate_ids(concat_frames(variable_chunks),
+                                  ['index', 'State', 'Variabletype'],
+                                  ignore_index=True)
+    del elems_res_chunks, variable_chunks
+    # categoricals of different parts and states are joined as objects by
+    # concat, they are stored as categoricals again
+    for frame in (elems_res, variable):
+        if not frame.empty:
+            frame[['State', 'Variabletype']] = \
+                frame[['State', 'Variabletype']].astype('category')
 
     file.closeFile()
 
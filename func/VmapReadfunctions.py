@@ -20,8 +20,14 @@ import pandas as pd
 import numpy as np
 import PyVMAP as VMAP
 
+# TET10 definition from VMAP to PERMAS: the i-th PERMAS node is the VMAP node
+# tet10_vmap2permas[i], see rearrange_tet10
+tet10_vmap2permas = np.array([0, 4, 1, 5, 2, 6, 7, 8, 9, 3])
+# inverse: the VMAP node i is the PERMAS node tet10_permas_position[i]
+tet10_permas_position = np.argsort(tet10_vmap2permas)
 
-def read_geometry_points(file, grp="/VMAP/GEOMETRY/0"):
+
+def read_geometry_points(file, grp="/VMAP/GEOMETRY/0", dtype=np.float64):
     """
     Read POINTS of the group /VMAP/GEOMETRY/<PART-ID>.
 
@@ -29,6 +35,8 @@ def read_geometry_points(file, grp="/VMAP/GEOMETRY/0"):
     ----------------
     file:   VMAP-file with read access: file=VMAP.VMAPFile(FILENAME,2)
     grp:    VMAP-group or string with path
+    dtype:  dtype of the coordinates. np.float32 halves their memory, but
+            keeps only about 7 significant digits
 
     Returns:
     --------
@@ -36,18 +44,19 @@ def read_geometry_points(file, grp="/VMAP/GEOMETRY/0"):
     """
     geomPointsRead = VMAP.sPointsBlock()
     file.readPointsBlock(grp, geomPointsRead)
-    geomIdCo = []
-    for i in range(geomPointsRead.mySize):
-        # read out coordinates and IDs from the "geomPointsRead" (Points block of the VMAP file)
-        geomCoords = [geomPointsRead.myCoordinates[3*i],
-                      geomPointsRead.myCoordinates[3*i+1], geomPointsRead.myCoordinates[3*i+2]]
-        geomIds = [geomPointsRead.myIdentifiers[i]]
-
-        # geometric Coordinates and geometric IDs in one list
-        geom = geomIds.copy()
-        geom.extend(geomCoords)
-        geomIdCo.append(geom)
-    geompandas = pd.DataFrame(geomIdCo, columns=['nodes', 'x', 'y', 'z'])
+    num_points = geomPointsRead.mySize
+    # read out coordinates and IDs from the "geomPointsRead" (Points block of
+    # the VMAP file). each member is fetched once from PyVMAP and copied into
+    # an array in one pass
+    geomCoords = np.fromiter(geomPointsRead.myCoordinates, dtype=dtype,
+                             count=3*num_points).reshape(num_points, 3)
+    geomIds = np.fromiter(geomPointsRead.myIdentifiers, dtype=np.int64,
+                          count=num_points)
+
+    # geometric IDs and Coordinates as columns, the coordinates array is
+    # used by the DataFrame without copying it
+    geompandas = pd.DataFrame(geomCoords, columns=['x', 'y', 'z'])
+    geompandas.insert(0, 'nodes', geomIds)
     return geompandas
 
 
@@ -68,20 +77,12 @@ def read_geometry_elementtypes(file):
     # read out elementtypes
     geomElemTypeRead = VMAP.VectorTemplateElementType()
     file.readElementTypes(geomElemTypeRead)
-    # initialize list with zeros that the data can be stacked
-    elementypes_list = np.zeros(2)
-    for item in geomElemTypeRead:
-        # read out the information of the elementtypes in hdf and append Identifier and Nodenumber
-        numItem = np.array(
-            (item.myIdentifier, item.myNumberOfNodes), dtype=VMAP.sElementType)
-        elementypes_list = np.vstack([elementypes_list, numItem])
-    # delete the first row with zeros
-    elementypes_list = np.delete(elementypes_list, 0, 0)
-
-    elementtypes_dict = dict(elementypes_list)
-    for numnodes in elementtypes_dict.values():
-        if numnodes != 8 and numnodes != 10:
-            print('WARNING: code is only tested for HEX8 and TET10')
+    # read out the information of the elementtypes in hdf: Identifier and
+    # Nodenumber, in a single pass
+    elementtypes_dict = {item.myIdentifier: item.myNumberOfNodes
+                         for item in geomElemTypeRead}
+    if set(elementtypes_dict.values()) - {8, 10}:
+        print('WARNING: code is only tested for HEX8 and TET10')
     return elementtypes_dict
 
 
@@ -101,30 +102,37 @@ def read_geometry_elems(file, elementtypes, grp="/VMAP/GEOMETRY/0"):
     """
     geomElemsBlockRead = VMAP.sElementBlock()
     file.readElementsBlock(grp, geomElemsBlockRead)
-    for i in range(geomElemsBlockRead.myElementsSize):
-        geomElementrow = geomElemsBlockRead.getElement(i)
-        identifier = [geomElementrow.myIdentifier]
-        elementtype = geomElementrow.myElementType
-
+    num_elements = geomElemsBlockRead.myElementsSize
+    # identifiers, number of nodes and connectivity are filled in place into
+    # the columns of one preallocated table, which is returned without copy.
+    # the connectivity of elements with less nodes is padded with zeros
+    table = np.zeros(
+        (num_elements, 2 + max(elementtypes.values(), default=0)),
+        dtype=np.int64)
+    identifiers = table[:, 0]
+    numnodes_all = table[:, 1]
+    connectivity = table[:, 2:]
+    # TET10 elements has to be rearranged, because VMAP has another sequence
+    # than PERMAS. the nodes are copied directly to their PERMAS position.
+    # number of nodes and positions are specialized once per elementtype
+    elementtypes_positions = {
+        elementtype: (numnodes, tet10_permas_position if numnodes == 10
+                      else np.arange(numnodes))
+        for elementtype, numnodes in elementtypes.items()}
+    # the PyVMAP method is looked up once, not per element
+    getElement = geomElemsBlockRead.getElement
+    for i in range(num_elements):
+        geomElementrow = getElement(i)
+        identifiers[i] = geomElementrow.myIdentifier
         # read out the number of nodes depending on elementtype from dict
-        numnodes = elementtypes[elementtype]
-        connectivity = []
-        # read out the elements
-        for j in range(numnodes):
-            connectivity.append(geomElementrow.myConnectivity[j])
-        # TET10 elements has to be rearranged, because VMAP has another sequence than PERMAS
-        if numnodes == 10:
-            connectivity = rearrange_tet10(connectivity)
-        elements = identifier.copy()
-        elements.extend([numnodes])
-        elements.extend(connectivity)
-        if i == 0:
-            geomelements = []
-            geomelements.append(elements)
-        else:
-            geomelements.append(elements)
-
-    elemspandas = pd.DataFrame(geomelements)
+        numnodes, positions = \
+            elementtypes_positions[geomElementrow.myElementType]
+        numnodes_all[i] = numnodes
+        connectivity[i, positions] = np.fromiter(
+            geomElementrow.myConnectivity, dtype=np.int64, count=numnodes)
+
+    # cols: identifier, number of nodes, connectivity
+    elemspandas = pd.DataFrame(table[:, :2 + numnodes_all.max(initial=0)])
     return elemspandas
 
 
@@ -153,17 +161,7 @@ def rearrange_tet10(elem_vmap):
     --------
     elem_permas: PERMAS tet10 element, list containing nodal indices
     """
-    elem_permas = [0]*10
-    elem_permas[0] = elem_vmap[0]
-    elem_permas[1] = elem_vmap[4]
-    elem_permas[2] = elem_vmap[1]
-    elem_permas[3] = elem_vmap[5]
-    elem_permas[4] = elem_vmap[2]
-    elem_permas[5] = elem_vmap[6]
-    elem_permas[6] = elem_vmap[7]
-    elem_permas[7] = elem_vmap[8]
-    elem_permas[8] = elem_vmap[9]
-    elem_permas[9] = elem_vmap[3]
+    elem_permas = [elem_vmap[i] for i in tet10_vmap2permas.tolist()]
     return elem_permas
 
 
@@ -191,34 +189,32 @@ def rearrange_tet10_res(values):
 
     Returns:
     --------
-    elements: Pandas Dataframe
+    elems: list
+        TET10 data (60 values) in PERMAS order
     """
-    elems = []
-    for i in range(6*6):
-        elems.insert(0, values.pop())
-    for i in range(6):
-        elems.insert(6*6, values.pop())
-    for i in range(6):
-        elems.insert(6*2, values.pop())
-    for i in range(6):
-        elems.insert(6*1, values.pop())
-    for i in range(6):
-        elems.insert(6*0, values.pop())
+    # 6 values per node, the nodes are permuted like the TET10 definition
+    elems = np.asarray(values).reshape(10, 6)[tet10_vmap2permas]\
+        .ravel().tolist()
     return elems
 
 
-def read_variables_points(file, index, grp="/VMAP/VARIABLES/STATE-0/0/", state="0", variablestype="DISPLACEMENT"):
+def read_variables_points(file, index, grp="/VMAP/VARIABLES/STATE-0/0/",
+                          state="0", variablestype="DISPLACEMENT",
+                          dtype=np.float64):
     """
     Read VARIABLES with respect to POINTS.
 
     Parameters
     ----------
     file:   VMAP-file with read access: file=VMAP.VMAPFile(FILENAME,2)
-    index:  Pandas DataFrame
-        points from VMAP Geometry (what the variables are dependend on)
+    index:  Pandas Series
+        ids of the points or elements from VMAP Geometry (what the variables
+        are dependend on)
     grp:    VMAP-group or string with path
     state:  state time
     variablestype: name of variable type (string)
+    dtype:  dtype of the values. np.float32 halves their memory, but keeps
+            only about 7 significant digits
 
     Returns
     -------
@@ -233,28 +229,31 @@ def read_variables_points(file, index, grp="/VMAP/VARIABLES/STATE-0/0/", state="
         counter = len(Ids)
     else:
         counter = index.shape[0]
-    variables = []
-    # count over all variables of this variabletype
-    for i in range(counter):
-        dimension = VariablesRead.myDimension
-        multiplicity = VariablesRead.myMultiplicity
-        values = []
-        for j in range(dimension*multiplicity):
-            values.append(
-                VariablesRead.myValues[j+i*dimension*multiplicity])
-        # Element stress with Tet10:
-        if len(values) == 60:
-            values = rearrange_tet10_res(values)
-
-        variables.append(values)
-
-    variablespandas = pd.DataFrame(variables)
+    # all variables of this variabletype, one row each, copied at once
+    num_values = VariablesRead.myDimension * VariablesRead.myMultiplicity
+    variables = np.fromiter(VariablesRead.myValues, dtype=dtype,
+                            count=counter*num_values)\
+        .reshape(counter, num_values)
+    # Element stress with Tet10: the nodes of all rows are permuted at once,
+    # like in rearrange_tet10_res
+    if num_values == 60:
+        variables = variables.reshape(counter, 10, 6)[:, tet10_vmap2permas]\
+            .reshape(counter, 60)
+
+    # the leading columns are built in one frame and joined to the values once
     if len(Ids) > 0:
-        variablespandas.insert(0, 'index', Ids)
+        ids = np.asarray(Ids)
     else:
-        variablespandas.insert(0, 'index', index[:])
-    variablespandas.insert(1, 'State', state)
-    variablespandas.insert(2, 'Variabletype', variablestype)
+        ids = index.to_numpy()
+    # state and variabletype are the same for all rows: categoricals with a
+    # single category store them once, with one code per row
+    codes = np.zeros(counter, dtype=np.int8)
+    variablespandas = pd.concat(
+        [pd.DataFrame({'index': ids,
+                       'State': pd.Categorical.from_codes(codes, [state]),
+                       'Variabletype': pd.Categorical.from_codes(
+                           codes, [variablestype])}),
+         pd.DataFrame(variables)], axis=1, copy=False)
 
     return variablespandas
 
@@ -274,25 +273,70 @@ def read_materialdata(file):
     MaterialReadVector = VMAP.VectorTemplateMaterial()
     file.readMaterialBlock(MaterialReadVector)
 
-    material_complete = pd.DataFrame([])
+    # name and value of each parameter are read directly from PyVMAP, each
+    # parameter is fetched once. one dict per material
+    materials = []
     for item in MaterialReadVector:
-        material_data = []
-        material = np.array((item.myIdentifier, item.myMaterialDescription, item.myMaterialName,
-                             item.myMaterialState, item.myMaterialSupplier, item.myMaterialType,
-                             ), dtype=VMAP.sMaterial)
-        material_data.append(['NAME', material[2]])
-        material_parameters_vec = []
-        for i in range(len(item.myMaterialCard.myParameters)):
-            material_parameters = np.array((item.myMaterialCard.myParameters[i].myName,
-                                            item.myMaterialCard.myParameters[i].myDescription,
-                                            item.myMaterialCard.myParameters[i].myValue), dtype=VMAP.sParameter)
-            material_parameters_vec.append(material_parameters)
-
-        for j in range(len(material_parameters_vec)):
-            name = material_parameters_vec[j][0]
-            value = material_parameters_vec[j][2]
-            material_data.append([name, value])
-        material_pd = pd.DataFrame(material_data).set_index(0)
-        material_complete = pd.concat([material_complete, material_pd], axis=1)
+        material = {'NAME': item.myMaterialName}
+        for parameter in item.myMaterialCard.myParameters:
+            material[parameter.myName] = parameter.myValue
+        materials.append(material)
+    # one row per material, with the union of the parameter names as
+    # columns, transposed to one column per material
+    material_complete = pd.DataFrame(materials).T
 
     return material_complete
+
+
+def partition_model(points, elements, esets, nsets):
+    """
+    Partition the model DataFrames of VmapRead into dictionaries of arrays.
+
+    Each table is split once by its key column, s.t. consumers get contiguous
+    arrays per part, element type or set without masking the whole table.
+
+    Parameters
+    ----------
+    points : Pandas DataFrame
+        Cols: nodes, part, x, y, z.
+    elements : Pandas DataFrame
+        Cols: element, part, elementtype, defining nodes.
+    esets : Pandas DataFrame
+        Cols: element, part, ...
+    nsets : Pandas DataFrame
+        Cols: node index (0), NAME. May be empty.
+
+    Returns
+    -------
+    points_np : np.array of float64
+        num-nodes x 4, first col is node index, remaining cols are coordinates
+    elements_types : dictionary
+        Number of nodes per element (keys) and np.array of int32 (values),
+        num-elems x (1 + number of nodes), first col is element index,
+        remaining cols are defining nodes.
+    esets_parts : dictionary
+        Partnames (keys) and element indices of the part (values).
+    nsets_names : dictionary
+        Names of nsets (keys, sorted) and their node indices (values).
+
+    """
+    points_np = points[['nodes', 'x', 'y', 'z']].to_numpy()
+
+    elementtype = elements.elementtype.to_numpy()
+    elements_types = {}
+    for numnodes in pd.unique(elementtype).tolist():
+        numnodes = int(numnodes)
+        columns = ['element'] + list(range(2, 2 + numnodes))
+        elements_types[numnodes] = elements.loc[
+            elementtype == numnodes, columns].to_numpy(dtype=np.int32)
+
+    esets_parts = {part: esets_part.to_numpy() for part, esets_part
+                   in esets.groupby('part', sort=False).element}
+
+    if nsets.empty:
+        nsets_names = {}
+    else:
+        nsets_names = {name: nsets_part.to_numpy() for name, nsets_part
+                       in nsets.groupby('NAME')[0]}
+
+    return points_np, elements_types, esets_parts, nsets_names
@@ -18,8 +18,43 @@ limitations under the License.
 
 import PyVMAP as VMAP
 import numpy as np
+import contextlib
 import datetime
 import sys
+from . import auxiliary as aux
+
+# derived units written by VmapWriteInitial: identifier, symbol, dimension
+derived_units = (
+    (8, 'N', (1, 1, -2, 0, 0, 0, 0)),
+    (9, 'mm^2', (2, 0, 0, 0, 0, 0, 0)),
+    (10, 'MPa', (-1, 1, -2, 0, 0, 0, 0)),
+    (11, 'mJ', (2, 1, -2, 0, 0, 0, 0)),
+    (12, 'mW', (2, 1, -3, 0, 0, 0, 0)))
+
+
+@contextlib.contextmanager
+def VmapWriteFile(filename):
+    """
+    Open a VMAP file for writing, to be used in a with-statement.
+
+    The file is closed on leaving the with-block, also if an error occurs.
+    PyVMAP offers no control over buffering, so writes are flushed when
+    closing the file.
+
+    Parameters
+    ----------
+    filename : string
+
+    Yields
+    ------
+    outputfile : open VMAPFile
+
+    """
+    outputfile = VMAP.VMAPFile(filename)
+    try:
+        yield outputfile
+    finally:
+        outputfile.closeFile()
 
 
 def VmapWriteInitial(openfile):
@@ -39,15 +74,13 @@ def VmapWriteInitial(openfile):
     # set version attribute automatically from __PyVMAP
     VMAP.sVersion()
 
-    # set metadata
-    hour = datetime.datetime.now().hour
-    minute = datetime.datetime.now().minute
-    second = datetime.datetime.now().second
-    time = '%s:%s:%s' % (hour, minute, second)
+    # set metadata. date and time are taken from a single clock reading,
+    # s.t. they are consistent
+    now = datetime.datetime.now()
     metaInfo = VMAP.sMetaInformation()
     metaInfo.setExporterName('Permashdf2Vmap')
-    metaInfo.setFileDate(str(datetime.date.today()))
-    metaInfo.setFileTime(time)
+    metaInfo.setFileDate(str(now.date()))
+    metaInfo.setFileTime(now.strftime('%H:%M:%S'))
     # metaInfo.setDescription('Description')
     # metaInfo.setAnalysisType('AnalysisType')
     # metaInfo.setUserId('UserID')
@@ -68,21 +101,9 @@ def VmapWriteInitial(openfile):
     myUnitSystem.getLuminousIntensityUnit().setUnitSymbol('cd')
     openfile.writeUnitSystem(myUnitSystem)
 
-    systems = []
-    systems.append(
-        np.array((8, 'N', (1, 1, -2, 0, 0, 0, 0)), dtype=VMAP.sUnit))
-    systems.append(
-        np.array((9, 'mm^2', (2, 0, 0, 0, 0, 0, 0)), dtype=VMAP.sUnit))
-    systems.append(
-        np.array((10, 'MPa', (-1, 1, -2, 0, 0, 0, 0)), dtype=VMAP.sUnit))
-    systems.append(
-        np.array((11, 'mJ', (2, 1, -2, 0, 0, 0, 0)), dtype=VMAP.sUnit))
-    systems.append(
-        np.array((12, 'mW', (2, 1, -3, 0, 0, 0, 0)), dtype=VMAP.sUnit))
-
     unitSystem = VMAP.VectorTemplateUnit()
 
-    for item in systems:
+    for item in derived_units:
         myUnit = VMAP.sUnit()
         myUnit.setIdentifier(item[0])
         myUnit.setUnitSymbol(item[1])
@@ -116,7 +137,8 @@ def VmapWriteVariables(openfile,
     Parameters
     ----------
     openfile : open VMAPfile
-    results : Pandas dataframe
+    results : np.array or Pandas dataframe
+        First column contains the geometric IDs, remaining columns the values.
     all other parameters: self-explanatory
 
     Returns
@@ -128,7 +150,9 @@ def VmapWriteVariables(openfile,
         grp = "/VMAP/VARIABLES/%s/%s/" % (state, part_id)
     variable = VMAP.sStateVariable()
 
-    results = np.array(results)
+    # no copy if results is a float64 array already, as passed by
+    # PermasHdf2Vmap
+    results = np.asarray(results, dtype=np.float64)
 
     # Coordinatesystem kartesian = 1, cylindircal = 2,3
     variable.setCoordinateSystem(coordinatesystem)
@@ -157,25 +181,55 @@ def VmapWriteVariables(openfile,
     if location == 4:
         IntegrationType = int(dimension/6)
 
-    # geometric IDs are optional - only used if state variable is defined over a set
-    if part_length != results.shape[0]:
-        geomIDs = results[:, 0]
-        geomIDs = geomIDs.astype(int)
-
-    results_without_index = np.delete(results, 0, 1)
+    # the values are copied only once, row by row, when flattening the view
+    # without the index column
+    results_to_file = results[:, 1:].ravel()
 
-    results_to_file = results_without_index.reshape(
-        results_without_index.shape[0]*results_without_index.shape[1])
-
-    # geometric IDs are optional - only used when state variable is defined over a set
+    # PyVMAP converts Python sequences into its std::vector members, and
+    # numpy arrays are converted item by item through numpy scalars. tolist
+    # builds the Python numbers in C, which is the fastest way through the
+    # bindings
+    # geometric IDs are optional - only used when state variable is defined over a set.
+    # they are cast from the float column and converted only then
     if part_length != results.shape[0]:
-        variable.setGeometryIds(geomIDs.tolist())
+        variable.setGeometryIds(results[:, 0].astype(np.int64).tolist())
 
     variable.setValues(results_to_file.tolist())
     openfile.writeVariable(grp, variable)
     return
 
 
+def VmapWriteStates(outputfile, analysis_info, num_parts):
+    """
+    Write STATE-X information and create the groups STATE-X/PART.
+
+    PyVMAP does not offer batched versions of setVariableStateInformation and
+    createVariablesGroup, so all calls are gathered here in two tight loops.
+
+    Parameters
+    ----------
+    outputfile : open VMAPFile
+    analysis_info : see PermasResultsRead
+    num_parts : int
+        Number of parts.
+
+    Returns
+    -------
+    variables_groups : list of lists of VMAP groups
+        One list per temporal value, containing one group per part.
+
+    """
+    statename = analysis_info['STATENAME_string']
+    temporal_values = [float(tval) for tval in analysis_info['temporal_values']]
+    for ct_tval, tval in enumerate(temporal_values):
+        outputfile.setVariableStateInformation(
+            ct_tval, statename, tval, tval, -1)
+    variables_groups = [[outputfile.createVariablesGroup(ct_tval, ct_part)
+                         for ct_part in range(num_parts)]
+                        for ct_tval in range(len(temporal_values))]
+    return variables_groups
+
+
 def VmapWriteCoorsys(outputfile, coorsystems):
     """
     Write coordinate systems to VMAP.
@@ -360,8 +414,8 @@ def VmapWriteGeometry(outputfile,
     parts_numnodes : dictionary
         Relates partnames to number of nodes within the respective part.
     esets_nodes_unique : list of np.arrays of int32
-        For each part contains an array of unique node indices within that
-        part.
+        For each part contains a sorted array of unique node indices within
+        that part.
 
     """
     # TODO: standard coordinate system needs to be written to VMAP and be correctly refered to from ELEMENTS. to this end, its ID needs to be determined dynamically because there might be arbitrary other coor sys ID's
@@ -373,6 +427,23 @@ def VmapWriteGeometry(outputfile,
             ct_part, partname)
         geometry_groups.append(geometry_part)
 
+    # first nodes of nsets as unique integers for membership tests via np.isin.
+    # nsets_first_inverse restores the order of nsets_first
+    nsets_first_unique, nsets_first_inverse = np.unique(
+        nsets_first, return_inverse=True)
+
+    # materials by name, built once for all parts. in reversed order, s.t. the
+    # first material of a name is kept, like in a sequential search
+    materials_names = {material['name']: material
+                       for material in reversed(materials)}
+
+    # sfsets containing each surf ID, in order of sfsets. built once, s.t.
+    # the sfsets of a surf are looked up instead of searched in every part
+    surfs_sfsets = {}
+    for ct_sfset, sfset_ids in enumerate(sfsets_ids):
+        for surf_id in set(sfset_ids):
+            surfs_sfsets.setdefault(surf_id, []).append(ct_sfset)
+
     # part-by-part final postprocessing and writing of VMAP
     # by combining postproc and writing in single loop, everything is more on-the-fly and requires less memory
     esets_nodes_unique = []
@@ -382,22 +453,18 @@ def VmapWriteGeometry(outputfile,
 
         # %%% material ID of part
         mat_id = -1
-        found_mat = False
-        if len(eset_material) > 0:
-            for material in materials:
-                if eset_material[partnames[ct_eset]] == material['name']:
-                    mat_id = material['id']
-                    print('  material: ' +
-                          material['name'] + ' (' + str(mat_id) + ')')
-                    found_mat = True
-                    break
-        if not found_mat:
+        material = materials_names.get(eset_material.get(partnames[ct_eset]))
+        if material is not None:
+            mat_id = material['id']
+            print('  material: ' +
+                  material['name'] + ' (' + str(mat_id) + ')')
+        else:
             print('  WARNING: no material found. setting ID=-1, continuing')
 
         # %%% ELEMENTS & eset_definition
         # this will find the element definitions of eset, i.e. of the current part
         # this is necessary because PERMAS lacks the part-hierarchy. instead, the model definition is always 'flat'
-        # paradigm: loop exactly once through global list of element definitions
+        # paradigm: look up all elements of eset at once by bisection in the sorted element IDs
 
         # set current elements depending on type of eset. this is efficient because of aliasing.
         if esets_types[ct_eset] == 'HEXE8':
@@ -409,61 +476,61 @@ def VmapWriteGeometry(outputfile,
         else:
             print('ERROR: something wrong with type of eset')
             sys.exit(1)
-        # set counters and max counter value
-        ct_elem_all = -1
-        ct_elem_set = -1
-        ct_elem_all_max = current_elements_ids.shape[0]  # just for debugging
+        eset_found = aux.contains(current_elements_ids, eset)
+        if not eset_found.all():
+            print('ERROR: elements of ' + partnames[ct_eset] +
+                  ' not found in ' + esets_types[ct_eset] + ' elements: ' +
+                  str(eset[~eset_found].tolist()))
+            sys.exit(1)
         # allocate memory for element definitions
         eset_definition = np.zeros(
             (len(eset), current_elements.shape[1]), dtype=np.int32)
-        # loop over elements of eset
-        for eid in eset:
-            # TODO if there is any other conversion of members of eset, then pre-convert esets in PermasPostprocess
-            eid_int = int(eid)
-            while True:
-                ct_elem_all += 1
-                if ct_elem_all == ct_elem_all_max:
-                    print('DEBUG ERROR: eid is not part of current_elements_ids')
-                    break
-                # found element's id
-                if current_elements_ids[ct_elem_all] == eid_int:
-                    ct_elem_set += 1
-                    # store element's definition
-                    eset_definition[ct_elem_set, :] = \
-                        current_elements[ct_elem_all, :]
-                    break
+        # store elements' definitions
+        eset_definition[:, :] = current_elements[
+            np.searchsorted(current_elements_ids, eset), :]
         # create element block, fill it with elements, and write it to VMAP file
         print('  ELEMENTS ... ', end='')
         elemBlock = VMAP.sElementBlock(eset_definition.shape[0])
         # -1 because definition contains element ID
         elemVMAP = VMAP.sElement(eset_definition.shape[1]-1)
-        for ct_elem_definition, elem_definition in enumerate(eset_definition):
-            elemVMAP.setIdentifier(int(elem_definition[0]))
-            elemVMAP.setCoordinateSystem(coordinatesystem)
-            elemVMAP.setMaterialType(mat_id)
-            elemVMAP.setElementType(
-                esettype_to_vmapelemtype[esets_types[ct_eset]])
-            elemVMAP.setConnectivity(elem_definition[1:].tolist())
+        # the element is copied into the block by setElement, so the
+        # attributes common to all elements of the part are set only once
+        elemVMAP.setCoordinateSystem(coordinatesystem)
+        elemVMAP.setMaterialType(mat_id)
+        elemVMAP.setElementType(
+            esettype_to_vmapelemtype[esets_types[ct_eset]])
+        # the definitions are converted to Python ints in one pass
+        for ct_elem_definition, elem_definition in enumerate(
+                eset_definition.tolist()):
+            elemVMAP.setIdentifier(elem_definition[0])
+            elemVMAP.setConnectivity(elem_definition[1:])
             elemBlock.setElement(ct_elem_definition, elemVMAP)
         outputfile.writeElementsBlock(part_group, elemBlock)
         print('done')
 
         # %%% esets_node_unique
         # get list of unique node IDs whithin this part. again, this is necessary because PERMAS models are always 'flat'.
-        esets_nodes_unique.append(np.unique(eset_definition[:, 1:]))  # sorted!
+        esets_nodes_unique.append(
+            aux.unique_ids(eset_definition[:, 1:]))  # sorted!
         parts_numnodes[partnames[ct_eset]] = esets_nodes_unique[-1].shape[0]
 
         # %%% POINTS
         print('  POINTS ... ', end='')
         geomPoints = VMAP.sPointsBlock(esets_nodes_unique[-1].shape[0])
-        ct_nd_all = -1
-        for ct_eset_node, eset_node_id in enumerate(esets_nodes_unique[-1]):
-            while True:
-                ct_nd_all += 1
-                if nodes_all_ids[ct_nd_all] == eset_node_id:
-                    geomPoints.setPoint(ct_eset_node, int(
-                        eset_node_id), nodes[ct_nd_all, 1:])
-                    break
+        # look up the rows of all nodes of the part at once by bisection in
+        # the sorted node IDs, like the elements above. searchsorted returns
+        # the row of a neighbouring node for a missing ID, so check first
+        nodes_found = aux.contains(nodes_all_ids, esets_nodes_unique[-1])
+        if not nodes_found.all():
+            print('ERROR: nodes of ' + partnames[ct_eset] +
+                  ' not found in nodes: ' +
+                  str(esets_nodes_unique[-1][~nodes_found].tolist()))
+            sys.exit(1)
+        nodes_rows = np.searchsorted(nodes_all_ids, esets_nodes_unique[-1])
+        for ct_eset_node, (eset_node_id, node_row) in enumerate(zip(
+                esets_nodes_unique[-1].tolist(), nodes_rows.tolist())):
+            geomPoints.setPoint(ct_eset_node, eset_node_id,
+                                nodes[node_row, 1:])
         outputfile.writePointsBlock(part_group, geomPoints)
         print('done')
 
@@ -472,60 +539,61 @@ def VmapWriteGeometry(outputfile,
         geometrysetVector = VMAP.VectorTemplateGeometrySet()
 
         # %%%% NSETs to parts
-        # convert esets_nodes_unique[-1] to set because 'in' operator is more efficient: https://wiki.python.org/moin/TimeComplexity
+        # both esets_nodes_unique[-1] and nsets_first_unique are sorted and
+        # unique, so np.isin can test all nsets at once without building a set
+        # the names of the sets are collected and printed at once per part
         print('    NSETS ...', end='')
-        print_dots = False
-        set_esets_nodes_unique = set(esets_nodes_unique[-1])
-        for ct_nset, nset_first in enumerate(nsets_first):
-            # TODO compare efficiency to 'if nset_first in esets_nodes_unique[-1]'
-            if int(nset_first) in set_esets_nodes_unique:
-                if print_dots == False:
-                    print()
-                print_dots = True
-                print('      ' + nsets_names[ct_nset])
-                myGeometrySet = VMAP.sGeometrySet()
-                myGeometrySet.setSetType(
-                    myGeometrySet.NODE_LOCATION)  # nodal geometry set
-                myGeometrySet.setSetIndexType(
-                    myGeometrySet.SINGLE_INDEX_TYPE)  # single value per entry
-                myGeometrySet.setSetName(nsets_names[ct_nset])
-                # this is unknown to PERMAS, it's just the chronological order of the NSET's in the model
-                myGeometrySet.setIdentifier(ct_nset)
-                myGeometrySet.setGeometrySetData(
-                    [int(node) for node in nsets[ct_nset]])
-                geometrysetVector.push_back(myGeometrySet)
-        print('    ... done') if print_dots else print(' done')
+        nsets_in_part = np.isin(nsets_first_unique, esets_nodes_unique[-1],
+                                assume_unique=True)[nsets_first_inverse]
+        ct_nsets_part = np.flatnonzero(nsets_in_part).tolist()
+        sets_lines = []
+        for ct_nset in ct_nsets_part:
+            sets_lines.append('      ' + nsets_names[ct_nset] + '\n')
+            myGeometrySet = VMAP.sGeometrySet()
+            myGeometrySet.setSetType(
+                myGeometrySet.NODE_LOCATION)  # nodal geometry set
+            myGeometrySet.setSetIndexType(
+                myGeometrySet.SINGLE_INDEX_TYPE)  # single value per entry
+            myGeometrySet.setSetName(nsets_names[ct_nset])
+            # this is unknown to PERMAS, it's just the chronological order of the NSET's in the model
+            myGeometrySet.setIdentifier(ct_nset)
+            myGeometrySet.setGeometrySetData(nsets[ct_nset].tolist())
+            geometrysetVector.push_back(myGeometrySet)
+        if ct_nsets_part:
+            print('\n' + ''.join(sets_lines) + '    ... done')
+        else:
+            print(' done')
 
         # %%%% SURFs to parts
-        # convert eset to set because 'in' operator is more efficient: https://wiki.python.org/moin/TimeComplexity
+        # all surfs are tested at once by their first elements, like the nsets
         # assumption: surfs are w.r.t. one eset only
         print('    SURFACES ...', end='')
-        set_eset = set(eset)
-        print_dots = False
-        for ct_surf, firstelem in enumerate(surfs_firstel):
-            # TODO compare efficiency to 'if firstelem in eset' w/o set conversion
-            if str(firstelem) in set_eset:
-                if print_dots == False:
-                    print()
-                print_dots = True
-                # here, we know the surface surfs[ct_surf] is in eset. is has the ID surfs_ids[ct_surf].
-                # now we need to find the sfset containing this surface, via the latter's ID
-                for ct_sfset, sfset_ids in enumerate(sfsets_ids):
-                    if surfs_ids[ct_surf] in sfset_ids:
-                        print('      ' + sfsets_names[ct_sfset] +
-                              ' (surf_id ' + surfs_ids[ct_surf] + ')')
-                        myGeometrySet = VMAP.sGeometrySet()
-                        # element geometry set
-                        myGeometrySet.setSetType(myGeometrySet.ELEMENT_LOCATION)
-                        myGeometrySet.setSetIndexType(
-                            myGeometrySet.PAIR_INDEX_TYPE)  # two values per entry
-                        myGeometrySet.setSetName(
-                            sfsets_names[ct_sfset] + '_' + surfs_ids[ct_surf])
-                        myGeometrySet.setIdentifier(int(surfs_ids[ct_surf]))
-                        myGeometrySet.setGeometrySetData(
-                            [int(elem_or_face) for elem_or_face in surfs_flat[ct_surf]])  # TODO the result should be 2 dimensional
-                        geometrysetVector.push_back(myGeometrySet)
-        print('    ... done') if print_dots else print(' done')
+        surfs_in_part = np.isin(surfs_firstel, eset)
+        ct_surfs_part = np.flatnonzero(surfs_in_part).tolist()
+        sets_lines = []
+        for ct_surf in ct_surfs_part:
+            # here, we know the surface surfs[ct_surf] is in eset. is has the ID surfs_ids[ct_surf].
+            # now we need to find the sfset containing this surface, via the latter's ID
+            for ct_sfset in surfs_sfsets.get(surfs_ids[ct_surf], []):
+                sets_lines.append('      ' + sfsets_names[ct_sfset] +
+                                  ' (surf_id ' + surfs_ids[ct_surf] + ')\n')
+                myGeometrySet = VMAP.sGeometrySet()
+                # element geometry set
+                myGeometrySet.setSetType(myGeometrySet.ELEMENT_LOCATION)
+                myGeometrySet.setSetIndexType(
+                    myGeometrySet.PAIR_INDEX_TYPE)  # two values per entry
+                myGeometrySet.setSetName(
+                    sfsets_names[ct_sfset] + '_' + surfs_ids[ct_surf])
+                myGeometrySet.setIdentifier(int(surfs_ids[ct_surf]))
+                # TODO the result should be 2 dimensional
+                myGeometrySet.setGeometrySetData(
+                    [int(elem_or_face)
+                     for elem_or_face in surfs_flat[ct_surf]])
+                geometrysetVector.push_back(myGeometrySet)
+        if ct_surfs_part:
+            print('\n' + ''.join(sets_lines) + '    ... done')
+        else:
+            print(' done')
 
         if geometrysetVector.size() > 0:
             outputfile.writeGeometrySets(part_group, geometrysetVector)
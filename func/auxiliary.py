@@ -16,12 +16,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import numpy as np
 import os
+import re
 import sys
 
 sep_big = '==========\n'
 sep_small = '----------\n'
 
+# optional command line argument of check_argv: <option>=<value>
+argv_option = re.compile(r'(timesteps|variables_nodes)=(.*)')
+
 
 def check_argv(argv, list_suffix):
     """
@@ -64,17 +69,16 @@ def check_argv(argv, list_suffix):
         INPUTFILENAME_results_split = [INPUTFILENAME_model_split[-1]]
         INPUTFILENAME_results = ''
 
-    timesteps = ''
-    variables_nodes = ''
-    if len(argv) >= 3:
-        for i in range(len(argv)-len_argv_filenames):
-            if 'timesteps' in argv[i+len_argv_filenames]:
-                timesteps = argv[i+len_argv_filenames].split('=')[1]
-            elif 'variables_nodes' in argv[i+len_argv_filenames]:
-                variables_nodes = argv[i+len_argv_filenames].split('=')[1]
-            else:
-                print('ERROR: Wrong number of arguments, must be >1 .\n' + usage_string)
-                sys.exit(1)
+    # each optional argument is matched once as a whole
+    options = {'timesteps': '', 'variables_nodes': ''}
+    for arg in argv[len_argv_filenames:]:
+        option = argv_option.fullmatch(arg)
+        if option is None:
+            print('ERROR: Wrong argument ' + arg + '.\n' + usage_string)
+            sys.exit(1)
+        options[option.group(1)] = option.group(2)
+    timesteps = options['timesteps']
+    variables_nodes = options['variables_nodes']
 
     for suff in list_suffix:
         if INPUTFILENAME_model_split[-1] == suff and INPUTFILENAME_results_split[-1] == suff:
@@ -127,6 +131,79 @@ def assert_file_exists(filename):
     return
 
 
+def print_timings(timings):
+    """
+    Print the durations of the conversion steps as a single table.
+
+    Parameters
+    ----------
+    timings : dictionary
+        Names of the steps (keys) and their wall-clock durations in seconds
+        (values), in chronological order.
+
+    Returns
+    -------
+    None.
+
+    """
+    width = max(len(step) for step in timings)
+    table = ''.join('{:<{}} {:9.3f}s\n'.format(step.upper(), width, duration)
+                    for step, duration in timings.items())
+    print(sep_small + 'WALL-CLOCK TIME\n' + table + sep_small, end='')
+    return
+
+
+def contains(sorted_ids, ids):
+    """
+    Check which IDs are contained in a sorted array of IDs, by bisection.
+
+    Parameters
+    ----------
+    sorted_ids : np.array of int
+        1D, sorted in ascending order, may be empty.
+    ids : np.array of int
+        IDs to be looked up.
+
+    Returns
+    -------
+    found : np.array of bool
+        Same shape as ids, True where the ID is contained in sorted_ids.
+
+    """
+    positions = np.searchsorted(sorted_ids, ids)
+    found = positions < len(sorted_ids)
+    found[found] = sorted_ids[positions[found]] == ids[found]
+    return found
+
+
+def unique_ids(ids):
+    """
+    Get the sorted unique values of non-negative integer IDs, like np.unique.
+
+    If the IDs are non-negative and the largest is at most a few times the
+    number of IDs, the IDs are marked in a boolean array over their range,
+    which replaces the sort of np.unique by two linear passes. Otherwise,
+    np.unique is used.
+
+    Parameters
+    ----------
+    ids : np.array of int
+        Any shape.
+
+    Returns
+    -------
+    unique : np.array
+        1D, sorted, same dtype as ids.
+
+    """
+    if ids.size == 0 or ids.min() < 0 or ids.max() > 4*ids.size:
+        return np.unique(ids)
+    is_id = np.zeros(ids.max() + 1, dtype=bool)
+    is_id[ids] = True
+    unique = np.flatnonzero(is_id).astype(ids.dtype, copy=False)
+    return unique
+
+
 def determine_times_vars(timesteps_user, variables_node_user, variable_nodes_exist):
     """
     Determine timesteps and variables that should be extracted.
@@ -157,7 +234,7 @@ def determine_times_vars(timesteps_user, variables_node_user, variable_nodes_exi
         timesteps_user = ['DEFAULT']
     elif timesteps_user == 'NONE':
         # no timestep
-        timesteps_user == ['NONE']
+        timesteps_user = ['NONE']
     elif len(timesteps_user) == 0:
         # timesteps users not specified
         timesteps_user = ['DEFAULT']